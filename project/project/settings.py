@@ -81,6 +81,34 @@ DATABASES = {
 }
 
 
+# Cache
+# locmem - локальная замена Redis для разработки и тестов
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shop',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+    # Без кэширования, для замеров производительности
+    'dummy': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -99,10 +127,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-# Custom authentication backends
+# Число итераций PBKDF2, 0 - значение Django по умолчанию.
+# Уменьшать только на стендах нагрузочного тестирования
+PASSWORD_HASHER_ITERATIONS = int(os.getenv('PASSWORD_HASHER_ITERATIONS', '0'))
+
+PASSWORD_HASHERS = [
+    'shop.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Custom authentication backends. ModelBackend после него не нужен:
+# username он ищет так же, а лишний хэш на неудачном входе удваивает его цену
 AUTHENTICATION_BACKENDS = [
     'shop.authentication.EmailOrUsernameModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
 LANGUAGE_CODE = 'ru-ru'
@@ -117,15 +157,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Ширины уменьшенных копий изображений товаров и категорий (px)
+IMAGE_DERIVATIVE_WIDTHS = [int(width) for width in os.getenv('IMAGE_DERIVATIVE_WIDTHS', '200,400,800').split(',')]
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # настройки rest api
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        'shop.authentication.CachedJWTAuthentication',
+        'shop.authentication.CachedTokenAuthentication',
+        'shop.authentication.TimedSessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -135,7 +178,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'shop.pagination.ShopPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -153,8 +196,18 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_OBTAIN_SERIALIZER': 'shop.custom_serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'shop.custom_serializers.ClaimsTokenRefreshSerializer',
 }
 
+# Пользователь по JWT и токену хранится в памяти процесса (секунды),
+# смена пароля, деактивация и удаление токена сбрасывают запись
+PRINCIPAL_CACHE_TIMEOUT = int(os.getenv('PRINCIPAL_CACHE_TIMEOUT', '30'))
+
+# Пользователь для GET-запросов из полей JWT, без обращения к БД.
+# Метки отзыва хранятся в кэше: нужен общий кэш без вытеснения (Redis с noeviction)
+JWT_USER_CLAIMS = os.getenv('JWT_USER_CLAIMS', 'False').lower() == 'true'
+
 # кастомная регистрация
 DJOSER = {
     'SERIALIZERS': {
@@ -176,5 +229,64 @@ CORS_ALLOW_CREDENTIALS = True
 
 CORS_ALLOW_ALL_ORIGINS = True  
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
-SESSION_COOKIE_AGE = 60 * 60 * 24 * 14
\ No newline at end of file
+# Сессии в кэше с записью в БД: чтение из кэша, при вытеснении или
+# рестарте сессия восстанавливается из БД. Просмотр каталога сессию не
+# создаёт и в БД не пишет. Подписанные cookie не подходят - ключ сессии
+# меняется при каждом сохранении, а корзина анонима привязана к нему.
+# Чистый backends.cache допустим только на общем кэше (redis), см. shop.checks
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+SESSION_COOKIE_AGE = 60 * 60 * 24 * 14
+
+# Удержание товара в корзине (минуты), 0 - без удержания
+CART_HOLD_MINUTES = int(os.getenv('CART_HOLD_MINUTES', '0'))
+
+# Время жизни кэша фасетов каталога (секунды)
+FACETS_CACHE_TIMEOUT = int(os.getenv('FACETS_CACHE_TIMEOUT', '300'))
+
+# Кэш ответов каталога и справочников (shop.cache.VersionedCache)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+
+# На кэше в памяти процесса (locmem) сброс поколения не виден другим
+# процессам: записи и само поколение там живут не дольше этого времени
+# (секунды), устаревшие данные и ETag остаются в других процессах не дольше.
+# Для нескольких процессов без задержки нужен общий кэш (CACHE_BACKEND=redis)
+PROCESS_CACHE_TIMEOUT = int(os.getenv('PROCESS_CACHE_TIMEOUT', '60'))
+
+# Время жизни кэша справочников (секунды), сбрасывается сигналами моделей
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', '3600'))
+
+# Время жизни кэша ответов каталога (секунды), сбрасывается при изменении товаров
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '600'))
+
+# max-age для браузеров и CDN в ответах каталога и справочников (секунды)
+CATALOG_HTTP_MAX_AGE = int(os.getenv('CATALOG_HTTP_MAX_AGE', '60'))
+
+# Фоновые задачи (shop.queue), хранятся в БД.
+# database - выполняет manage.py run_tasks, thread - потоки веб-процесса
+# с планировщиком (shop.queue.start_scheduler в wsgi.py/asgi.py),
+# immediate - сразу после фиксации транзакции (тесты, отладка)
+TASK_QUEUE_MODE = os.getenv('TASK_QUEUE_MODE', 'thread')
+TASK_THREADS = int(os.getenv('TASK_THREADS', '2'))
+# Опрос БД обработчиком run_tasks (секунды)
+TASK_POLL_INTERVAL = float(os.getenv('TASK_POLL_INTERVAL', '1'))
+# Опрос БД планировщиком режима thread (секунды). Опрашивает каждый веб-процесс,
+# поэтому реже: задачи из delay() запускаются сразу и без опроса, он нужен
+# только для периодических задач и повторов, оставшихся после перезапуска
+TASK_SCHEDULER_INTERVAL = float(os.getenv('TASK_SCHEDULER_INTERVAL', '10'))
+# running дольше этого времени (секунды) считается брошенной и запускается снова
+TASK_STALE_AFTER = int(os.getenv('TASK_STALE_AFTER', '600'))
+TASK_RETENTION_DAYS = int(os.getenv('TASK_RETENTION_DAYS', '7'))
+# Периодические задачи и интервал в секундах, их ставят run_tasks и планировщик режима thread
+TASK_PERIODIC = {
+    'shop.stock.release_expired_holds': 300,
+    'shop.queue.prune_tasks': 3600,
+}
+
+# Почта для писем о заказах
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False').lower() == 'true'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'shop@localhost')
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+# Фоновые задачи в потоках веб-процесса (TASK_QUEUE_MODE=thread)
+from shop.queue import start_scheduler  # noqa: E402
+
+start_scheduler()
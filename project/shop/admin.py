@@ -3,6 +3,34 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from .models import *
 
+
+class ProductListFilter(admin.SimpleListFilter):
+    """
+    Фильтр по товару без списка всех товаров в боковой панели:
+    показывается только выбранный товар (?product=<id>),
+    найти товар можно поиском по названию или артикулу
+    """
+    title = 'Товар'
+    parameter_name = 'product'
+    product_path = None
+    
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if value and value.isdigit():
+            title = Product.objects.filter(pk=value).values_list('title', flat=True).first()
+            if title is not None:
+                return [(value, title)]
+        return []
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.product_path}_id': self.value()})
+        return queryset
+
+
+def product_filter(path):
+    return type('ProductListFilter', (ProductListFilter,), {'product_path': path})
+
 # прокси модель для профиля
 class EmployeeInline(admin.StackedInline):
     model = CustomerProfile
@@ -38,7 +66,10 @@ class ProductImageInline(admin.TabularInline):
 class ProductVariantAdmin(admin.ModelAdmin):
     list_display = ('product', 'color', 'is_default')
     list_filter = ('color', 'is_default')
-    search_fields = ('product__title', 'color__name')
+    search_fields = ('product__title', 'product__article', 'color__name')
+    list_select_related = ('product', 'color')
+    autocomplete_fields = ('product',)
+    show_full_result_count = False
     inlines = [ProductImageInline, ProductStockInline]
 
 # товар
@@ -51,6 +82,10 @@ class ProductAdmin(admin.ModelAdmin):
     filter_horizontal = ('categories',)
     list_editable = ('price', 'sale_price', 'is_available')
     date_hierarchy = 'created_at'
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('search_vector')
 
 # цвета
 @admin.register(Color)
@@ -68,20 +103,27 @@ class SizeAdmin(admin.ModelAdmin):
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ('variant', 'alt_text', 'sort_order')
-    list_filter = ('variant__product',)
-    search_fields = ('variant__product__title', 'alt_text')
+    list_filter = (product_filter('variant__product'),)
+    search_fields = ('variant__product__title', 'variant__product__article', 'alt_text')
+    list_select_related = ('variant__product', 'variant__color')
+    autocomplete_fields = ('variant',)
+    show_full_result_count = False
 
 # 
 @admin.register(ProductStock)
 class ProductStockAdmin(admin.ModelAdmin):
     list_display = ('get_product', 'get_color', 'size', 'quantity')
-    list_filter = ('variant__product', 'variant__color', 'size')
-    search_fields = ('variant__product__title',)
+    list_filter = (product_filter('variant__product'), 'variant__color', 'size')
+    search_fields = ('variant__product__title', 'variant__product__article')
     list_editable = ('quantity',)
+    list_select_related = ('variant__product', 'variant__color', 'size')
+    autocomplete_fields = ('variant',)
+    show_full_result_count = False
     
     def get_product(self, obj):
         return obj.variant.product.title
     get_product.short_description = 'Product'
+    get_product.admin_order_field = 'variant__product__title'
     
     def get_color(self, obj):
         return obj.variant.color.name
@@ -94,11 +136,15 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_filter = ('added_at',)
     search_fields = ('user__username', 'product__title')
     date_hierarchy = 'added_at'
+    list_select_related = ('user', 'product')
+    autocomplete_fields = ('user', 'product')
+    show_full_result_count = False
 
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
+    autocomplete_fields = ('product_stock',)
 
 # Корзина
 @admin.register(Cart)
@@ -108,18 +154,34 @@ class CartAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'session_id')
     date_hierarchy = 'created_at'
     inlines = [CartItemInline]
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # Сумма корзины подзапросом, а не перебором строк каждой корзины
+        return super().get_queryset(request).with_total()
     
     def get_total_price(self, obj):
-        return obj.total_price
+        return obj.items_total or 0
     get_total_price.short_description = 'Total Price'
+    get_total_price.admin_order_field = 'items_total'
 
 # Товары в корзине
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('cart', 'get_product', 'get_color', 'get_size', 'quantity', 'added_at')
-    list_filter = ('added_at', 'product_stock__variant__product')
-    search_fields = ('cart__user__username', 'product_stock__variant__product__title')
+    list_filter = ('added_at', product_filter('product_stock__variant__product'))
+    search_fields = (
+        'cart__user__username', 'product_stock__variant__product__title',
+        'product_stock__variant__product__article',
+    )
     list_editable = ('quantity',)
+    list_select_related = (
+        'cart__user', 'product_stock__variant__product', 'product_stock__variant__color', 'product_stock__size'
+    )
+    autocomplete_fields = ('cart', 'product_stock')
+    show_full_result_count = False
     
     def get_product(self, obj):
         return obj.product_stock.variant.product.title
@@ -137,6 +199,7 @@ class CartItemAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    autocomplete_fields = ('product', 'variant')
 
 # Заказ
 @admin.register(Order)
@@ -146,4 +209,18 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'full_name', 'email', 'phone')
     list_editable = ('status',)
     date_hierarchy = 'created_at'
-    inlines = [OrderItemInline]
\ No newline at end of file
+    inlines = [OrderItemInline]
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    show_full_result_count = False
+
+
+# фоновые задачи
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'duration', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'duration', 'last_error')
+    show_full_result_count = False
@@ -1,6 +1,43 @@
-from django.contrib.auth.backends import ModelBackend
+import copy
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
 from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework import permissions
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .cache import stats as cache_stats
+
+# Поля пользователя в JWT и метка времени, на которую они актуальны
+JWT_USER_CLAIMS = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser')
+JWT_CLAIMS_AT = 'claims_at'
+
+
+def find_login_user(login):
+    """
+    Пользователь по username или email без учёта регистра.
+    Условие на LOWER(...) совпадает с функциональными индексами
+    auth_user_username_lower_idx и auth_user_email_lower_idx.
+    """
+    login = login.lower()
+    users = list(
+        User.objects.alias(username_lower=Lower('username'), email_lower=Lower('email'))
+        .filter(Q(username_lower=login) | Q(email_lower=login))
+        .order_by('pk')[:2]
+    )
+    # Совпадение по username важнее чужого email с тем же значением
+    for user in users:
+        if user.username.lower() == login:
+            return user
+    return users[0] if users else None
 
 
 class EmailOrUsernameModelBackend(ModelBackend):
@@ -13,11 +50,8 @@ class EmailOrUsernameModelBackend(ModelBackend):
         if username is None or password is None:
             return None
         
-        try:
-            user = User.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            )
-        except User.DoesNotExist:
+        user = find_login_user(username)
+        if user is None:
             # Run the default password hasher once to reduce the timing
             # difference between an existing and a nonexistent user (#20760).
             User().set_password(password)
@@ -25,4 +59,182 @@ class EmailOrUsernameModelBackend(ModelBackend):
         
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
-        return None
\ No newline at end of file
+        return None
+
+
+class PrincipalCache:
+    """
+    Пользователи, найденные по JWT и токенам, в памяти процесса
+    на PRINCIPAL_CACHE_TIMEOUT секунд. Отзыв (смена пароля, деактивация,
+    удаление токена) - метка времени в общем кэше, её видят все процессы.
+    """
+
+    namespace = 'principals'
+    max_entries = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def revoked_key(self, user_id):
+        return f'shop:principal:{user_id}:revoked'
+
+    def revoked_at(self, user_id):
+        return cache.get(self.revoked_key(user_id))
+
+    def get(self, key):
+        """Сохранённое значение (пользователь или токен) или None"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            value, user_id, stored_at, expires = entry
+            revoked_at = self.revoked_at(user_id)
+            if expires > time.monotonic() and (revoked_at is None or revoked_at < stored_at):
+                cache_stats.incr(self.namespace, 'hits')
+                # Копия: запрос может менять атрибуты объекта
+                return copy.copy(value)
+            self.discard(key)
+        cache_stats.incr(self.namespace, 'misses')
+        return None
+
+    def set(self, key, value, user_id):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: entry for k, entry in self._entries.items() if entry[3] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (value, user_id, time.time(), now + settings.PRINCIPAL_CACHE_TIMEOUT)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def revoke(self, user_id):
+        # Метка живёт, пока действуют выданные токены с полями пользователя,
+        # включая refresh: из него выпускаются новые access
+        timeout = max(
+            settings.PRINCIPAL_CACHE_TIMEOUT,
+            int(jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds()),
+            int(jwt_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+        )
+        cache.set(self.revoked_key(user_id), time.time(), timeout)
+        cache_stats.incr(self.namespace, 'invalidations')
+        with self._lock:
+            self._entries = {k: entry for k, entry in self._entries.items() if entry[1] != user_id}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principals = PrincipalCache()
+
+
+class AuthStats:
+    """Время аутентификации по схемам (в пределах процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {'calls': 0, 'authenticated': 0, 'total_time': 0.0, 'max_time': 0.0})
+
+    def record(self, scheme, duration, authenticated):
+        with self._lock:
+            counters = self._counters[scheme]
+            counters['calls'] += 1
+            counters['authenticated'] += int(authenticated)
+            counters['total_time'] += duration
+            counters['max_time'] = max(counters['max_time'], duration)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                scheme: dict(counters, avg_time=counters['total_time'] / counters['calls'])
+                for scheme, counters in self._counters.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+auth_stats = AuthStats()
+
+
+class TimedAuthenticationMixin:
+    """Замер authenticate() для AuthStats, scheme - имя схемы в отчёте"""
+    scheme = None
+
+    def authenticate(self, request):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = super().authenticate(request)
+            return result
+        finally:
+            auth_stats.record(self.scheme, time.perf_counter() - started, result is not None)
+
+
+class CachedJWTAuthentication(TimedAuthenticationMixin, JWTAuthentication):
+    """
+    JWT с пользователем из PrincipalCache. При JWT_USER_CLAIMS безопасные
+    запросы получают пользователя из полей токена без обращения к БД,
+    пока после выдачи полей пользователь не менялся.
+    """
+    scheme = 'jwt'
+
+    def authenticate(self, request):
+        self.use_claims = settings.JWT_USER_CLAIMS and request.method in permissions.SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        if self.use_claims:
+            user = self.get_claims_user(validated_token, user_id)
+            if user is not None:
+                return user
+
+        key = ('user', user_id)
+        user = principals.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            principals.set(key, user, user.pk)
+        return user
+
+    def get_claims_user(self, validated_token, user_id):
+        """Пользователь из полей токена или None, если их нет или они устарели"""
+        claims_at = validated_token.get(JWT_CLAIMS_AT)
+        if claims_at is None:
+            return None
+        revoked_at = principals.revoked_at(user_id)
+        if revoked_at is not None and revoked_at >= claims_at:
+            return None
+        user = User(
+            is_active=True,
+            **{jwt_settings.USER_ID_FIELD: user_id},
+            **{claim: validated_token.get(claim) for claim in JWT_USER_CLAIMS}
+        )
+        # Объект из БД: годится для фильтров по связям, но не для save()
+        user._state.adding = False
+        user._state.db = 'default'
+        return user
+
+
+class CachedTokenAuthentication(TimedAuthenticationMixin, TokenAuthentication):
+    """TokenAuthentication с пользователем из PrincipalCache по ключу токена"""
+    scheme = 'token'
+
+    def authenticate_credentials(self, key):
+        cache_key = ('token', key)
+        token = principals.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            principals.set(cache_key, token, user.pk)
+        return copy.copy(token.user), token
+
+
+class TimedSessionAuthentication(TimedAuthenticationMixin, SessionAuthentication):
+    scheme = 'session'
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class CacheStats:
+    """Счётчики попаданий/промахов по пространствам имён (в пределах процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {'hits': 0, 'misses': 0, 'waits': 0, 'invalidations': 0})
+
+    def incr(self, namespace, counter):
+        with self._lock:
+            self._counters[namespace][counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for namespace, counters in self._counters.items():
+                total = counters['hits'] + counters['misses']
+                result[namespace] = dict(counters, hit_ratio=round(counters['hits'] / total, 4) if total else None)
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+stats = CacheStats()
+
+# Поколение каталога: товары, варианты, фото и остатки
+CATALOG_CACHE_NAMESPACE = 'catalog'
+
+
+class VersionedCache:
+    """
+    Кэш с версионированными ключами: сброс пространства имён - это
+    увеличение счётчика версии, старые ключи просто истекают.
+    """
+
+    # Блокировка пересборки снимается сама, если процесс упал
+    lock_timeout = 30
+    wait_timeout = 5
+    wait_interval = 0.05
+
+    def __init__(self, namespace, timeout=None, alias='default'):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        return settings.RESPONSE_CACHE_ENABLED
+
+    @property
+    def shared(self):
+        return is_shared_cache(self.alias)
+
+    def limit_timeout(self, timeout):
+        """Время жизни в кэше процесса не больше PROCESS_CACHE_TIMEOUT: сброс не дойдёт до соседей"""
+        if self.shared:
+            return timeout
+        if timeout is None:
+            return settings.PROCESS_CACHE_TIMEOUT
+        return min(timeout, settings.PROCESS_CACHE_TIMEOUT)
+
+    @property
+    def version_key(self):
+        return f'shop:{self.namespace}:version'
+
+    def get_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            # Начальная версия по времени, чтобы после вытеснения счётчика
+            # не вернуться к уже использованному номеру
+            self.cache.add(self.version_key, time.time_ns(), self.limit_timeout(None))
+            version = self.cache.get(self.version_key)
+        return version
+
+    def version_time(self, version):
+        """Время начала поколения, Unix time: версия - время сброса в наносекундах"""
+        return version // 10 ** 9
+
+    def format_key(self, suffix, version):
+        digest = hashlib.md5(suffix.encode()).hexdigest()
+        return f'shop:{self.namespace}:{version}:{digest}'
+
+    def make_key(self, suffix):
+        return self.format_key(suffix, self.get_version())
+
+    def get_timeout(self):
+        return self.limit_timeout(self.timeout if self.timeout is not None else settings.REFERENCE_CACHE_TIMEOUT)
+
+    def get_or_set(self, suffix, builder):
+        """
+        Значение из кэша или результат builder() (None не кэшируется).
+        Пересборку истёкшего ключа выполняет один процесс, остальные
+        ждут его результат до wait_timeout секунд.
+        """
+        return self.fetch(self.make_key(suffix), builder)
+
+    def fetch(self, key, builder):
+        """get_or_set по готовому ключу из make_key"""
+        if not self.enabled:
+            return builder()
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + self.wait_timeout
+        locked = waited = False
+        while True:
+            value = self.cache.get(key)
+            if value is not None:
+                stats.incr(self.namespace, 'hits')
+                return value
+            locked = self.cache.add(lock_key, 1, self.lock_timeout)
+            if locked or time.monotonic() >= deadline:
+                break
+            if not waited:
+                stats.incr(self.namespace, 'waits')
+                waited = True
+            time.sleep(self.wait_interval)
+
+        stats.incr(self.namespace, 'misses')
+        try:
+            value = builder()
+            if value is not None:
+                self.cache.set(key, value, self.get_timeout())
+        finally:
+            if locked:
+                self.cache.delete(lock_key)
+        return value
+
+    def invalidate(self):
+        stats.incr(self.namespace, 'invalidations')
+        # Новая версия - время сброса, оно же Last-Modified ответов поколения
+        version = max(time.time_ns(), (self.cache.get(self.version_key) or 0) + 1)
+        self.cache.set(self.version_key, version, self.limit_timeout(None))
+
+
+def is_shared_cache(alias='default'):
+    """Кэш, который видят все процессы: locmem у каждого процесса свой"""
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def request_cache_suffix(action, request):
+    """Действие, хост, путь и нормализованные параметры GET-запроса"""
+    params = urlencode(sorted(
+        (key, sorted(value for value in values if value))
+        for key, values in request.GET.lists()
+    ), doseq=True)
+    return f'{action}|{request.get_host()}|{request.path}|{params}'
+
+
+def response_etag(key, fmt):
+    # Версия пространства имён входит в ключ, формат - в представление
+    return quote_etag(hashlib.md5(f'{key}|{fmt}'.encode()).hexdigest())
+
+
+def set_cache_headers(response, etag, last_modified=None):
+    """Валидаторы и Cache-Control: public для общих кэшей"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_HTTP_MAX_AGE)
+    patch_vary_headers(response, ['Accept'])
+    return response
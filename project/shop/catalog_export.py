@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch, Q
+
+from .models import Product, ProductStock, ProductVariant
+
+# Колонки CSV: те же, что читает import_catalog, и поля только для чтения
+CSV_COLUMNS = [
+    'article', 'title', 'slug', 'price', 'sale_price', 'effective_price', 'description', 'composition',
+    'is_available', 'categories', 'main_image_url', 'updated_at',
+    'color', 'color_code', 'is_default', 'size', 'quantity',
+]
+
+
+def export_queryset(since=None):
+    """
+    Товары для выгрузки. Полная выгрузка - только доступные товары,
+    инкрементальная (since) - все изменённые, чтобы снятые с продажи
+    тоже дошли до партнёра. Остатки и фото меняют только карточку,
+    поэтому учитывается и её updated_at. Удаление товара и привязка
+    к категориям updated_at не меняют: инкрементальная выгрузка их
+    не видит, партнёру нужна периодическая полная.
+    """
+    stocks = ProductStock.objects.select_related('size').order_by('size__display_order', 'pk')
+    variants = ProductVariant.objects.select_related('color').prefetch_related(
+        Prefetch('stocks', queryset=stocks)
+    ).order_by('pk')
+    queryset = Product.objects.defer('search_vector').select_related('card').prefetch_related(
+        Prefetch('variants', queryset=variants), 'categories'
+    ).order_by('pk')
+    if since is None:
+        return queryset.filter(is_available=True)
+    return queryset.filter(Q(updated_at__gte=since) | Q(card__updated_at__gte=since))
+
+
+def product_record(product, build_url):
+    """Товар с вариантами и остатками для JSONL"""
+    card = getattr(product, 'card', None)
+    image_url = card.main_image_url if card is not None else ''
+    return {
+        'article': product.article,
+        'title': product.title,
+        'slug': product.slug,
+        'price': product.price,
+        'sale_price': product.sale_price,
+        'effective_price': card.effective_price if card is not None else product.sale_price or product.price,
+        'description': product.description,
+        'composition': product.composition,
+        'is_available': product.is_available,
+        'categories': [category.slug for category in product.categories.all()],
+        'main_image_url': build_url(image_url) if image_url else '',
+        'updated_at': max(product.updated_at, card.updated_at) if card is not None else product.updated_at,
+        'variants': [
+            {
+                'color': variant.color.name,
+                'color_code': variant.color.code,
+                'is_default': variant.is_default,
+                'stocks': [{'size': stock.size.name, 'quantity': stock.quantity} for stock in variant.stocks.all()],
+            }
+            for variant in product.variants.all()
+        ],
+    }
+
+
+def csv_rows(record):
+    """Строки CSV по единицам учёта, товар без вариантов - одна строка без размера"""
+    product = {key: value for key, value in record.items() if key != 'variants'}
+    product['categories'] = '|'.join(record['categories'])
+    rows = [
+        dict(product, color=variant['color'], color_code=variant['color_code'], is_default=variant['is_default'],
+             size=stock['size'], quantity=stock['quantity'])
+        for variant in record['variants'] for stock in variant['stocks'] or [{'size': '', 'quantity': ''}]
+    ]
+    return rows or [product]
+
+
+def export_chunks(queryset, fmt, build_url, chunk_size=500):
+    """
+    Выгрузка кусками по chunk_size товаров: серверный курсор
+    и prefetch на каждую пачку, в памяти только текущая пачка
+    """
+    buffer = io.StringIO()
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+
+    for count, product in enumerate(queryset.iterator(chunk_size=chunk_size), 1):
+        record = product_record(product, build_url)
+        if writer is not None:
+            writer.writerows(csv_rows(record))
+        else:
+            buffer.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+            buffer.write('\n')
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
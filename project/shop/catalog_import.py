@@ -0,0 +1,292 @@
+import csv
+import gzip
+import io
+import json
+import sys
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .cache import CATALOG_CACHE_NAMESPACE, VersionedCache
+from .models import Category, Color, Product, ProductCard, ProductStock, ProductVariant, Size
+from .search import get_search_backend
+
+# Поля товара, которые обновляет повторный импорт (slug и дата создания остаются).
+# Обновляются только колонки, которые есть в строке
+PRODUCT_UPDATE_FIELDS = ['title', 'price', 'sale_price', 'description', 'composition', 'is_available', 'updated_at']
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+
+
+class ImportRowError(ValueError):
+    """Строка файла не годится для импорта"""
+
+
+def open_source(path):
+    """Текстовый поток файла, .gz распаковывается на лету, '-' - stdin"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(stream, fmt):
+    """Строки файла по одной: (номер строки, dict)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield line_num, ImportRowError(f'некорректный JSON: {exc}')
+
+
+def text(row, field, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ImportRowError(f'не заполнено поле {field}')
+    return value
+
+
+def decimal(row, field, required=False):
+    value = text(row, field, required)
+    if not value:
+        return None
+    try:
+        return Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ImportRowError(f'{field}: не число {value!r}')
+
+
+def integer(row, field, default=0):
+    value = text(row, field)
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ImportRowError(f'{field}: не целое число {value!r}')
+    if number < 0:
+        raise ImportRowError(f'{field}: отрицательное значение')
+    return number
+
+
+def boolean(row, field, default):
+    value = row.get(field)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def upsert(model, objects, unique_fields, update_fields):
+    """
+    bulk_create с обновлением при конфликте. objects - пары (объект, поля строки):
+    пачка делится по набору полей, отсутствующие в файле не затираются
+    """
+    groups = defaultdict(list)
+    for obj, fields in objects:
+        groups[tuple(field for field in update_fields if field in fields)].append(obj)
+    for fields, group in groups.items():
+        if fields:
+            model.objects.bulk_create(
+                group, update_conflicts=True, unique_fields=unique_fields, update_fields=list(fields)
+            )
+        else:
+            model.objects.bulk_create(group, ignore_conflicts=True)
+
+
+def slug_list(row, field):
+    """Слаги категорий: список в JSONL или через | в CSV"""
+    value = row.get(field) or []
+    if isinstance(value, str):
+        value = value.split('|')
+    return [slug.strip() for slug in value if slug and slug.strip()]
+
+
+class CatalogImporter:
+    """
+    Потоковый импорт каталога: одна строка - одна единица учёта
+    (артикул, цвет, размер, остаток) вместе с полями товара.
+    Товары, варианты и остатки записываются пачками upsert по
+    article, (product, color) и (variant, size). Справочники
+    держатся в памяти, пачки не накапливаются - память постоянная.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.colors = {name.lower(): pk for name, pk in Color.objects.order_by('-pk').values_list('name', 'pk')}
+        self.sizes = {name.lower(): pk for name, pk in Size.objects.order_by('-pk').values_list('name', 'pk')}
+        self.rows = 0
+        self.products = 0
+        self.errors = 0
+
+    def parse(self, row):
+        article = text(row, 'article', required=True)
+        title = text(row, 'title', required=True)
+        categories = slug_list(row, 'categories')
+        unknown = [slug for slug in categories if slug not in self.categories]
+        if unknown:
+            raise ImportRowError(f'неизвестные категории: {", ".join(unknown)}')
+        product = {
+            'title': title,
+            'slug': text(row, 'slug') or slugify(f'{title}-{article}', allow_unicode=False) or article,
+            'price': decimal(row, 'price', required=True),
+        }
+        # Необязательные колонки: нет в строке - у существующего товара остаётся старое значение
+        if 'sale_price' in row:
+            product['sale_price'] = decimal(row, 'sale_price')
+        for field in ('description', 'composition'):
+            if field in row:
+                product[field] = text(row, field)
+        if 'is_available' in row:
+            product['is_available'] = boolean(row, 'is_available', True)
+        return {
+            'article': article,
+            'product': product,
+            'categories': categories,
+            'color': text(row, 'color', required=True),
+            'color_code': text(row, 'color_code'),
+            'is_default': boolean(row, 'is_default', False) if 'is_default' in row else None,
+            'size': text(row, 'size', required=True),
+            'quantity': integer(row, 'quantity') if 'quantity' in row else None,
+        }
+
+    def run(self, rows, on_error=None, on_batch=None):
+        """rows - итератор (номер строки, dict или ImportRowError)"""
+        batch = []
+        for line_num, row in rows:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                batch.append(dict(self.parse(row), line=line_num))
+            except ImportRowError as exc:
+                self.error(line_num, exc, on_error)
+                continue
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch, on_error)
+                batch = []
+                if on_batch is not None:
+                    on_batch(self)
+        if batch:
+            self.save_batch(batch, on_error)
+            if on_batch is not None:
+                on_batch(self)
+
+    def error(self, line_num, exc, on_error):
+        self.errors += 1
+        if on_error is not None:
+            on_error(line_num, exc)
+
+    def check_slugs(self, batch, on_error):
+        """
+        Строки новых товаров со slug, который уже занят другим артикулом
+        в БД или в пачке, отбрасываются как ошибочные
+        """
+        existing = set(Product.objects.filter(
+            article__in={item['article'] for item in batch}
+        ).values_list('article', flat=True))
+        taken = dict(Product.objects.filter(
+            slug__in={item['product']['slug'] for item in batch if item['article'] not in existing}
+        ).values_list('slug', 'article'))
+        valid = []
+        for item in batch:
+            if item['article'] not in existing:
+                slug = item['product']['slug']
+                owner = taken.setdefault(slug, item['article'])
+                if owner != item['article']:
+                    self.error(item['line'], ImportRowError(f'slug {slug} занят товаром {owner}'), on_error)
+                    continue
+            valid.append(item)
+        return valid
+
+    def resolve_references(self, batch):
+        """pk цветов и размеров из памяти, недостающие создаются пачкой"""
+        for field, model, cache, extra in (
+            ('color', Color, self.colors, lambda item: {'code': item['color_code'] or '#000000'}),
+            ('size', Size, self.sizes, lambda item: {}),
+        ):
+            missing = {}
+            for item in batch:
+                key = item[field].lower()
+                if key not in cache and key not in missing:
+                    missing[key] = model(name=item[field], **extra(item))
+            if missing:
+                model.objects.bulk_create(missing.values())
+                # pk после bulk_create есть не на всех БД
+                created = model.objects.filter(name__in=[obj.name for obj in missing.values()])
+                for name, pk in created.order_by('-pk').values_list('name', 'pk'):
+                    cache.setdefault(name.lower(), pk)
+
+    @transaction.atomic
+    def save_batch(self, batch, on_error=None):
+        batch = self.check_slugs(batch, on_error)
+        if not batch:
+            return
+        self.resolve_references(batch)
+
+        # Последняя строка пачки задаёт поля товара
+        products = {}
+        for item in batch:
+            fields = item['product']
+            products[item['article']] = (Product(article=item['article'], **fields), {*fields, 'updated_at'})
+        upsert(Product, products.values(), ['article'], PRODUCT_UPDATE_FIELDS)
+        product_ids = dict(Product.objects.filter(article__in=products).values_list('article', 'pk'))
+
+        links = {
+            (product_ids[item['article']], self.categories[slug])
+            for item in batch for slug in item['categories']
+        }
+        Product.categories.through.objects.bulk_create(
+            [Product.categories.through(product_id=product_id, category_id=category_id)
+             for product_id, category_id in links],
+            ignore_conflicts=True,
+        )
+
+        variants = {}
+        for item in batch:
+            key = (product_ids[item['article']], self.colors[item['color'].lower()])
+            fields = {} if item['is_default'] is None else {'is_default': item['is_default']}
+            variants[key] = (ProductVariant(product_id=key[0], color_id=key[1], **fields), fields)
+        upsert(ProductVariant, variants.values(), ['product', 'color'], ['is_default'])
+        variant_ids = {
+            (product_id, color_id): pk
+            for pk, product_id, color_id in ProductVariant.objects.filter(
+                product_id__in=product_ids.values()
+            ).values_list('pk', 'product_id', 'color_id')
+        }
+
+        stocks = {}
+        for item in batch:
+            variant_id = variant_ids[(product_ids[item['article']], self.colors[item['color'].lower()])]
+            size_id = self.sizes[item['size'].lower()]
+            fields = {} if item['quantity'] is None else {'quantity': item['quantity']}
+            stocks[(variant_id, size_id)] = (ProductStock(variant_id=variant_id, size_id=size_id, **fields), fields)
+        upsert(ProductStock, stocks.values(), ['variant', 'size'], ['quantity'])
+
+        # bulk-операции не отправляют сигналы: производные данные пересчитываются здесь
+        ids = list(product_ids.values())
+        Product.objects.filter(pk__in=ids).refresh_audience()
+        ProductCard.objects.refresh(ids)
+        backend = get_search_backend()
+        if backend is not None:
+            backend.index(ids)
+
+        # Сброс кэша каталога после фиксации каждой пачки: ошибка в следующей
+        # пачке не оставит записанные товары за старым поколением кэша
+        transaction.on_commit(VersionedCache(CATALOG_CACHE_NAMESPACE).invalidate)
+
+        self.rows += len(batch)
+        self.products += len(ids)
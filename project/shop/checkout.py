@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Sum, Window
+
+from .models import Cart, CartItem, Order, OrderItem
+from .queue import task
+from .stock import InsufficientStock, consume_stock
+
+
+class CheckoutError(Exception):
+    """Заказ не может быть оформлен"""
+    
+    def __init__(self, message, product_stock_ids=()):
+        # Единицы учёта, которых не хватило на складе
+        self.product_stock_ids = list(product_stock_ids)
+        super().__init__(message)
+
+
+def place_order(user, serializer):
+    """
+    Оформление заказа из корзины пользователя в одной транзакции:
+    строки корзины с ценами и суммой заказа - одним запросом,
+    товары заказа - одним bulk_create.
+    """
+    with transaction.atomic():
+        # Блокировка корзины от повторного оформления параллельным запросом.
+        # no_key не конфликтует с добавлением товаров в эту корзину
+        cart = Cart.objects.select_for_update(no_key=True).filter(user=user).first()
+        if cart is None:
+            raise CheckoutError('No cart found')
+        
+        lines = list(
+            CartItem.objects.filter(cart=cart)
+            .with_prices()
+            .annotate(order_total=Window(Sum('line_total')))
+            .values(
+                'pk', 'quantity', 'unit_price', 'order_total', 'product_stock_id',
+                'product_stock__variant__product_id',
+                'product_stock__variant_id',
+                'product_stock__size_id',
+            )
+        )
+        if not lines:
+            raise CheckoutError('Cart is empty')
+        
+        try:
+            consume_stock(cart, [(line['product_stock_id'], line['quantity']) for line in lines])
+        except InsufficientStock as e:
+            raise CheckoutError(str(e), e.product_stock_ids) from e
+        
+        order = serializer.save(user=user, total_price=lines[0]['order_total'])
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line['product_stock__variant__product_id'],
+                variant_id=line['product_stock__variant_id'],
+                size_id=line['product_stock__size_id'],
+                price=line['unit_price'],
+                quantity=line['quantity'],
+            )
+            for line in lines
+        ])
+        
+        # Из корзины удаляются только оформленные строки: no_key не мешает
+        # параллельно добавить товар, и он должен остаться в корзине
+        CartItem.objects.filter(pk__in=[line['pk'] for line in lines]).delete()
+        
+        send_order_confirmation.delay(order_id=order.pk)
+    
+    return order
+
+
+@task(max_attempts=5, retry_delay=60)
+def send_order_confirmation(order_id):
+    """Письмо покупателю с составом заказа"""
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    
+    lines = [
+        f'{item.product.title} ({item.variant.color.name}, {item.size.name}) x {item.quantity} - {item.price}'
+        for item in order.items.select_related('product', 'variant__color', 'size')
+    ]
+    send_mail(
+        subject=f'Заказ №{order.pk} оформлен',
+        message='\n'.join([f'Здравствуйте, {order.full_name}!', '', *lines, '', f'Итого: {order.total_price}']),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[order.email],
+    )
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.checks import Error, Info, register
+
+from .cache import is_shared_cache
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    """Кэш ответов в памяти процесса: другие процессы видят сброс с задержкой (не для DEBUG)"""
+    if settings.RESPONSE_CACHE_ENABLED and not settings.DEBUG and not is_shared_cache():
+        return [Info(
+            'Кэш ответов в памяти процесса',
+            hint=f'Сброс поколения не дойдёт до других процессов, они отдают прежние данные до '
+                 f'{settings.PROCESS_CACHE_TIMEOUT} с (PROCESS_CACHE_TIMEOUT). Для нескольких процессов '
+                 f'подключите Redis (CACHE_BACKEND=redis).',
+            id='shop.I001',
+        )]
+    return []
+
+
+@register()
+def check_session_engine(app_configs, **kwargs):
+    """Сессии только в кэше теряются при вытеснении и не видны другим процессам на locmem"""
+    if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cache' and not is_shared_cache(
+        settings.SESSION_CACHE_ALIAS
+    ):
+        return [Error(
+            'Сессии в кэше памяти процесса',
+            hint='Корзины анонимов пропадут при вытеснении и между процессами: используйте '
+                 'SESSION_ENGINE=django.contrib.sessions.backends.cached_db или общий кэш (CACHE_BACKEND=redis).',
+            id='shop.E001',
+        )]
+    return []
+
+
+@register()
+def check_jwt_user_claims(app_configs, **kwargs):
+    """Метка отзыва в кэше процесса не дойдёт до других процессов, поля токена останутся в силе"""
+    if settings.JWT_USER_CLAIMS and not is_shared_cache():
+        return [Error(
+            'JWT_USER_CLAIMS на кэше в памяти процесса',
+            hint='Деактивация и снятие прав не отзовут поля в токенах: подключите Redis '
+                 '(CACHE_BACKEND=redis) без вытеснения ключей или выключите JWT_USER_CLAIMS.',
+            id='shop.E002',
+        )]
+    return []
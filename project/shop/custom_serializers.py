@@ -1,7 +1,14 @@
 # project/shop/custom_serializers.py
+import time
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import JWT_CLAIMS_AT, JWT_USER_CLAIMS
 from .models import CustomerProfile
 
 
@@ -56,4 +63,42 @@ class CustomUserSerializer(serializers.ModelSerializer):
             return {
                 'phone_number': '',
                 'address': ''
-            }
\ No newline at end of file
+            }
+
+
+def set_user_claims(token, user):
+    """Поля пользователя для JWT_USER_CLAIMS и время, на которое они актуальны"""
+    for claim in JWT_USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token[JWT_CLAIMS_AT] = time.time()
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Токены с полями пользователя для JWT_USER_CLAIMS"""
+    
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        set_user_claims(token, user)
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Новый access с полями пользователя из БД, а не из refresh:
+    снятые права и деактивация действуют с первого обновления
+    """
+    
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(
+            **{jwt_settings.USER_ID_FIELD: refresh.payload.get(jwt_settings.USER_ID_CLAIM)}
+        ).first()
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        set_user_claims(access, user)
+        data['access'] = str(access)
+        return data
@@ -0,0 +1,73 @@
+from django.db.models import Count, Q
+
+from .models import Category, ProductVariant, ProductStock, effective_price
+
+
+def price_bucket_filter(low, high):
+    """Условие попадания эффективной цены в [low, high)"""
+    condition = Q()
+    if low is not None:
+        condition &= Q(facet_price__gte=low)
+    if high is not None:
+        condition &= Q(facet_price__lt=high)
+    return condition
+
+
+def compute_facets(queryset, price_buckets):
+    """
+    Счётчики фильтров для текущей выборки товаров.
+    Каждый фасет - один сгруппированный запрос по подзапросу выборки.
+    """
+    product_ids = queryset.order_by().values('pk')
+
+    bounds = list(zip(price_buckets[:-1], price_buckets[1:]))
+    price_counts = queryset.order_by().annotate(facet_price=effective_price()).aggregate(
+        total=Count('pk', distinct=True),
+        **{
+            f'bucket_{i}': Count('pk', filter=price_bucket_filter(low, high), distinct=True)
+            for i, (low, high) in enumerate(bounds)
+        }
+    )
+
+    categories = (
+        Category.objects.filter(products__in=product_ids)
+        .values('id', 'name', 'slug', 'parent')
+        .annotate(count=Count('products', distinct=True))
+        .order_by('name')
+    )
+    genders = (
+        Category.objects.filter(products__in=product_ids)
+        .values('gender')
+        .annotate(count=Count('products', distinct=True))
+        .order_by('gender')
+    )
+    colors = (
+        ProductVariant.objects.filter(product__in=product_ids)
+        .values('color_id', 'color__name', 'color__code')
+        .annotate(count=Count('product', distinct=True))
+        .order_by('color__name')
+    )
+    sizes = (
+        ProductStock.objects.filter(variant__product__in=product_ids, quantity__gt=0)
+        .values('size_id', 'size__name', 'size__display_order')
+        .annotate(count=Count('variant__product', distinct=True))
+        .order_by('size__display_order')
+    )
+
+    return {
+        'count': price_counts['total'],
+        'categories': list(categories),
+        'genders': list(genders),
+        'colors': [
+            {'id': row['color_id'], 'name': row['color__name'], 'code': row['color__code'], 'count': row['count']}
+            for row in colors
+        ],
+        'sizes': [
+            {'id': row['size_id'], 'name': row['size__name'], 'count': row['count']}
+            for row in sizes
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': price_counts[f'bucket_{i}']}
+            for i, (low, high) in enumerate(bounds)
+        ],
+    }
@@ -0,0 +1,26 @@
+import django_filters
+from django.db.models import Exists, OuterRef
+
+from .models import Category, Product
+
+
+class ProductFilter(django_filters.FilterSet):
+    """Фильтры каталога, category_tree - категория вместе со всеми подкатегориями"""
+    category_tree = django_filters.CharFilter(method='filter_category_tree')
+    
+    class Meta:
+        model = Product
+        fields = ['categories', 'categories__gender']
+    
+    def filter_category_tree(self, queryset, name, value):
+        lookup = {'pk': value} if value.isdigit() else {'slug': value}
+        path = Category.objects.filter(**lookup).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        
+        # Один индексированный предикат path LIKE 'путь%' без DISTINCT по M2M
+        in_subtree = Product.categories.through.objects.filter(
+            product=OuterRef('pk'),
+            category__path__startswith=path,
+        )
+        return queryset.filter(Exists(in_subtree))
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 с числом итераций из PASSWORD_HASHER_ITERATIONS.
+    Алгоритм тот же, поэтому хэши совместимы со стандартным хэшером,
+    при входе пароль перехэшируется под текущее число итераций.
+    """
+    
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASHER_ITERATIONS or PBKDF2PasswordHasher.iterations
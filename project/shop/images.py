@@ -0,0 +1,100 @@
+import hashlib
+import io
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .queue import task
+
+# Формат файла -> (формат Pillow, параметры сохранения)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Отправляется после сохранения манифестов: sender - модель, pks - записи
+derivatives_ready = Signal()
+
+
+def resize(image, width):
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def encode(image, pil_format, options):
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_derivatives(name, storage=None):
+    """
+    Уменьшенные копии исходника в WebP и JPEG по ширинам IMAGE_DERIVATIVE_WIDTHS.
+    Путь зависит от хэша содержимого, поэтому одинаковые файлы не пересчитываются.
+    Возвращает манифест {'source': имя, 'formats': {формат: {ширина: путь}}}.
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as source:
+        content = source.read()
+    digest = hashlib.sha256(content).hexdigest()
+    base = f'derivatives/{digest[:2]}/{digest}'
+
+    manifest = {'source': name, 'formats': {fmt: {} for fmt in DERIVATIVE_FORMATS}}
+    with Image.open(io.BytesIO(content)) as original:
+        image = ImageOps.exif_transpose(original)
+        # Без увеличения: слишком маленький исходник даёт одну копию своей ширины
+        widths = [width for width in settings.IMAGE_DERIVATIVE_WIDTHS if width < image.width] or [image.width]
+        for width in widths:
+            resized = None
+            for fmt, (pil_format, options) in DERIVATIVE_FORMATS.items():
+                path = f'{base}/{width}.{fmt}'
+                if not storage.exists(path):
+                    if resized is None:
+                        resized = resize(image, width)
+                    saved = storage.save(path, ContentFile(encode(resized, pil_format, options)))
+                    if saved != path:
+                        # Тот же файл параллельно записал другой процесс
+                        storage.delete(saved)
+                manifest['formats'][fmt][str(width)] = path
+    return manifest
+
+
+def needs_derivatives(instance):
+    return bool(instance.image) and instance.derivatives.get('source') != instance.image.name
+
+
+def reset_derivatives(instance):
+    """Сброс манифеста при замене или удалении файла: копии прежнего файла не выводятся"""
+    if instance.derivatives and instance.derivatives.get('source') != (instance.image.name if instance.image else None):
+        instance.derivatives = {}
+
+
+def save_manifest(model, pk, manifest):
+    """Запись манифеста, если исходник не сменился, пока шла обработка"""
+    return model.objects.filter(pk=pk, image=manifest['source']).update(derivatives=manifest)
+
+
+@task(max_attempts=3, retry_delay=60)
+def build_derivatives(model, pk):
+    """Копии для одной записи, model - метка модели вида 'shop.ProductImage'"""
+    model = apps.get_model(model)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_derivatives(instance):
+        return
+    manifest = render_derivatives(instance.image.name, instance.image.storage)
+    if save_manifest(model, pk, manifest):
+        derivatives_ready.send(sender=model, pks=[pk])
+
+
+def schedule_derivatives(instance):
+    """Построение копий фоновой задачей, админка не ждёт обработки"""
+    if needs_derivatives(instance):
+        build_derivatives.delay(model=instance._meta.label, pk=instance.pk)
@@ -0,0 +1,156 @@
+import asyncio
+import io
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение пропускной способности WSGI и ASGI на горячих GET-эндпоинтах. '
+        'Запросы идут в приложение внутри процесса, без сети и веб-сервера. '
+        'Под ASGI те же синхронные viewset выполняются в пуле потоков: асинхронный ORM '
+        'Django 4.2 сам уходит в поток (sync_to_async), отдельных async view нет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['both', 'wsgi', 'asgi'], default='both')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--path', action='append', dest='paths', help='URL, можно указать несколько раз')
+        parser.add_argument('--no-cache', action='store_true', help='Без кэша ответов (CACHE_BACKEND=dummy)')
+
+    def handle(self, *args, **options):
+        if options['server'] == 'both':
+            for server in ('wsgi', 'asgi'):
+                self.run_subprocess(server, options)
+            return
+
+        paths = options['paths'] or self.default_paths()
+        urls = list(islice(cycle(paths), options['requests']))
+        runner = self.run_wsgi if options['server'] == 'wsgi' else self.run_asgi
+
+        started = time.perf_counter()
+        results = runner(urls, options['concurrency'])
+        elapsed = time.perf_counter() - started
+        self.report(options['server'], results, elapsed)
+
+    def run_subprocess(self, server, options):
+        """Каждый режим в отдельном процессе со своим кэшем и пулом соединений"""
+        env = dict(os.environ)
+        if options['no_cache']:
+            env['CACHE_BACKEND'] = 'dummy'
+        command = [
+            sys.executable, sys.argv[0], 'benchmark_entrypoints', '--server', server,
+            '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+        ]
+        for path in options['paths'] or []:
+            command += ['--path', path]
+        if subprocess.run(command, env=env).returncode:
+            raise CommandError(f'Замер {server} завершился с ошибкой')
+
+    def default_paths(self):
+        paths = ['/api/products/', '/api/products/?page=2', '/api/categories/', '/api/categories/tree/']
+        product_id = Product.objects.filter(is_available=True).values_list('pk', flat=True).first()
+        if product_id is not None:
+            paths.append(f'/api/products/{product_id}/')
+        return paths
+
+    @property
+    def host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        return hosts[0] if hosts else 'localhost'
+
+    def run_wsgi(self, urls, concurrency):
+        """Потоки как у многопоточного WSGI-сервера: concurrency одновременных запросов"""
+        application = WSGIHandler()
+
+        def call(url):
+            parts = urlsplit(url)
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': parts.path,
+                'QUERY_STRING': parts.query,
+                'SERVER_NAME': self.host,
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': self.host,
+                'HTTP_ACCEPT': 'application/json',
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr,
+            }
+            status = []
+            started = time.perf_counter()
+            body = application(environ, lambda code, headers: status.append(int(code.split()[0])))
+            b''.join(body)
+            body.close()
+            return status[0], time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(call, urls))
+
+    def run_asgi(self, urls, concurrency):
+        """Один цикл событий, concurrency одновременных запросов"""
+        application = ASGIHandler()
+
+        async def call(url, semaphore):
+            parts = urlsplit(url)
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': parts.path,
+                'raw_path': parts.path.encode(),
+                'query_string': parts.query.encode(),
+                'headers': [(b'host', self.host.encode()), (b'accept', b'application/json')],
+                'server': (self.host, 80),
+                'client': ('127.0.0.1', 0),
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # Клиент не отключается до конца ответа
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with semaphore:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                return status[0], time.perf_counter() - started
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(call(url, semaphore) for url in urls))
+
+        return asyncio.run(main())
+
+    def report(self, server, results, elapsed):
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for code, _ in results if code >= 400)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{server.upper()}: {len(results)} запросов за {elapsed:.2f} с, '
+            f'{len(results) / elapsed:.0f} запр/с, ошибок {errors}, '
+            f'p50 {statistics.median(latencies) * 1000:.1f} мс, p95 {p95 * 1000:.1f} мс'
+        ))
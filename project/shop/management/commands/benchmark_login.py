@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import check_password, get_hasher
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.authentication import find_login_user
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер входа по частям: поиск пользователя, хэширование пароля '
+        'и authenticate() целиком. Тестовый пользователь удаляется откатом транзакции'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--hasher-iterations', type=int, default=None,
+            help='Итерации PBKDF2 вместо PASSWORD_HASHER_ITERATIONS',
+        )
+
+    def handle(self, *args, **options):
+        if options['hasher_iterations'] is not None:
+            settings.PASSWORD_HASHER_ITERATIONS = options['hasher_iterations']
+        hasher = get_hasher()
+        self.stdout.write(f'Хэшер: {hasher.algorithm}, итераций {getattr(hasher, "iterations", "-")}')
+        self.stdout.write(f'Пользователей в auth_user: {User.objects.count()}')
+
+        try:
+            with transaction.atomic():
+                self.run(options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, iterations):
+        password = 'benchmark-password'
+        user = User.objects.create_user('benchmark_login', 'Benchmark.Login@example.com', password)
+        encoded = user.password
+
+        cases = [
+            ('поиск по username', lambda: find_login_user('BENCHMARK_login')),
+            ('поиск по email', lambda: find_login_user('benchmark.login@example.com')),
+            ('поиск: нет пользователя', lambda: find_login_user('missing@example.com')),
+            ('хэширование пароля', lambda: check_password(password, encoded)),
+            ('вход', lambda: authenticate(username='benchmark.login@example.com', password=password)),
+            ('вход: неверный пароль', lambda: authenticate(username='benchmark_login', password='wrong')),
+            ('вход: нет пользователя', lambda: authenticate(username='missing@example.com', password=password)),
+        ]
+        for name, call in cases:
+            self.report(name, measure(call, iterations))
+
+    def report(self, name, timings):
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: p50 {statistics.median(timings) * 1000:.2f} мс, p95 {p95 * 1000:.2f} мс'
+        ))
+
+
+def measure(call, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return timings
@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shop.images import derivatives_ready, needs_derivatives, render_derivatives, save_manifest
+from shop.models import Category, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Построение уменьшенных копий изображений товаров и категорий в несколько процессов'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help='Пересобрать и готовые манифесты')
+    
+    def handle(self, *args, **options):
+        jobs = []
+        for model in (ProductImage, Category):
+            queryset = model.objects.exclude(image='').exclude(image=None).only('pk', 'image', 'derivatives')
+            for instance in queryset.iterator():
+                if options['force'] or needs_derivatives(instance):
+                    jobs.append((model, instance.pk, instance.image.name))
+        
+        if not jobs:
+            self.stdout.write(self.style.SUCCESS('Все копии уже построены'))
+            return
+        
+        # Дочерние процессы не должны наследовать открытые соединения
+        connections.close_all()
+        done = {ProductImage: [], Category: []}
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            futures = {pool.submit(render_derivatives, name): (model, pk) for model, pk, name in jobs}
+            for future in as_completed(futures):
+                model, pk = futures[future]
+                try:
+                    manifest = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{model._meta.label} #{pk}: {exc}')
+                    continue
+                if save_manifest(model, pk, manifest):
+                    done[model].append(pk)
+        
+        for model, pks in done.items():
+            if pks:
+                derivatives_ready.send(sender=model, pks=pks)
+        
+        total = sum(len(pks) for pks in done.values())
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {total}, ошибок: {failed}'))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from shop.catalog_import import CatalogImporter, open_source, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт каталога из CSV или JSONL (можно .gz, "-" - stdin). '
+        'Строка - единица учёта: article, title, price, sale_price, description, composition, '
+        'is_available, categories (слаги через |), color, color_code, is_default, size, quantity'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if '.jsonl' in path or '.json' in path else 'csv')
+        importer = CatalogImporter(batch_size=options['batch_size'])
+        started = time.perf_counter()
+        
+        def on_error(line_num, exc):
+            self.stderr.write(f'Строка {line_num}: {exc}')
+        
+        def on_batch(importer):
+            if options['verbosity'] > 1:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{importer.rows} строк, {importer.rows / elapsed:.0f} строк/с')
+        
+        try:
+            with open_source(path) as stream:
+                importer.run(read_rows(stream, fmt), on_error=on_error, on_batch=on_batch)
+        except OSError as exc:
+            raise CommandError(f'Не удалось прочитать {path}: {exc}')
+        except IntegrityError as exc:
+            raise CommandError(f'Пачка после строки {importer.rows} не записана: {exc}')
+        
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано строк: {importer.rows}, товаров обновлено: {importer.products}, '
+            f'ошибок: {importer.errors}, {elapsed:.1f} с, {importer.rows / max(elapsed, 1e-9):.0f} строк/с'
+        ))
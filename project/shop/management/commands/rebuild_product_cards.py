@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from shop.models import Product, ProductCard
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт карточек товаров для списков каталога'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        
+        batch = []
+        total = 0
+        for product_id in product_ids.iterator(chunk_size=batch_size):
+            batch.append(product_id)
+            if len(batch) >= batch_size:
+                ProductCard.objects.refresh(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            ProductCard.objects.refresh(batch)
+            total += len(batch)
+        
+        self.stdout.write(self.style.SUCCESS(f'Обновлено карточек: {total}'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Полная переиндексация товаров для полнотекстового поиска'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None:
+            raise CommandError('Полнотекстовый поиск не поддерживается для этой БД')
+        
+        backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Индекс перестроен: {type(backend).__name__}'))
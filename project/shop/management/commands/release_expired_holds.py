@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.stock import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Снятие истёкших удержаний товаров в корзинах'
+    
+    def handle(self, *args, **options):
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f'Снято удержаний: {released}'))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.queue import due_tasks, ensure_periodic, execute, fail_abandoned
+
+
+class Command(BaseCommand):
+    help = 'Обработчик фоновых задач из БД, можно запускать несколько параллельно'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=settings.TASK_POLL_INTERVAL)
+    
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            ensure_periodic()
+            fail_abandoned()
+            batch = due_tasks(options['batch_size'])
+            for task_id in batch:
+                execute(task_id)
+            total += len(batch)
+            
+            if options['once'] and not batch:
+                break
+            if not batch:
+                time.sleep(options['sleep'])
+        
+        self.stdout.write(self.style.SUCCESS(f'Обработано задач: {total}'))
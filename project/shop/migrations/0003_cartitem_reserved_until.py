@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_card'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_gin')
+
+
+def create_search_index(apps, schema_editor):
+    """GIN-индекс для PostgreSQL, виртуальная таблица FTS5 для SQLite"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('shop', 'Product'), SEARCH_INDEX)
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE shop_product_fts USING fts5("
+            "title, article, description, composition, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('shop', 'Product'), SEARCH_INDEX)
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS shop_product_fts')
+
+
+def fill_search_index(apps, schema_editor):
+    """Индекс для существующих товаров, как rebuild_search_index"""
+    from shop.search import SEARCH_BACKENDS
+    
+    backend_class = SEARCH_BACKENDS.get(schema_editor.connection.vendor)
+    if backend_class is not None:
+        backend_class(model=apps.get_model('shop', 'Product')).rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_cartitem_reserved_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='product',
+                    index=SEARCH_INDEX,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_created_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['title', 'id'], name='product_title_keyset'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    categories = {category.pk: category for category in Category.objects.all()}
+    
+    def build_path(category):
+        if not category.path:
+            parent = categories.get(category.parent_id)
+            category.path = (build_path(parent) if parent else '') + f"{category.pk:08d}/"
+        return category.path
+    
+    for category in categories.values():
+        build_path(category)
+    Category.objects.bulk_update(categories.values(), ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
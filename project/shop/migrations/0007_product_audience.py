@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:18
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def fill_product_audience(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    
+    def in_gender(genders):
+        return Exists(Product.categories.through.objects.filter(
+            product=OuterRef('pk'), category__gender__in=genders
+        ))
+    
+    Product.objects.update(for_boys=in_gender(['B', 'U']), for_girls=in_gender(['G', 'U']))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='for_boys',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='for_girls',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['for_boys', 'is_available', 'created_at', 'id'], name='product_boys_feed'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['for_girls', 'is_available', 'created_at', 'id'], name='product_girls_feed'),
+        ),
+        migrations.RunPython(fill_product_audience, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_audience'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productcard',
+            name='main_image_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_missing_profiles(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    CustomerProfile = apps.get_model('shop', 'CustomerProfile')
+    user_ids = User.objects.filter(profile__isnull=True).values_list('pk', flat=True)
+    CustomerProfile.objects.bulk_create(
+        [CustomerProfile(user_id=user_id, phone_number='', address='') for user_id in user_ids.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_task'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
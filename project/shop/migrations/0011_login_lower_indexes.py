@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# Индексы на таблицу чужого приложения: создаются через schema_editor,
+# состояние модели auth.User не меняется
+LOGIN_INDEXES = [
+    models.Index(Lower('username'), name='auth_user_username_lower_idx'),
+    models.Index(Lower('email'), name='auth_user_email_lower_idx'),
+]
+
+
+def add_login_indexes(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    for index in LOGIN_INDEXES:
+        schema_editor.add_index(User, index)
+
+
+def remove_login_indexes(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    for index in LOGIN_INDEXES:
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_backfill_customer_profiles'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_login_indexes, remove_login_indexes),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef, Subquery
+
+
+def create_missing_cards(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+    ProductImage = apps.get_model('shop', 'ProductImage')
+    ProductStock = apps.get_model('shop', 'ProductStock')
+    ProductCard = apps.get_model('shop', 'ProductCard')
+    
+    first_variant = ProductVariant.objects.filter(
+        product=OuterRef(OuterRef('pk'))
+    ).order_by('pk').values('pk')[:1]
+    main_image = ProductImage.objects.filter(
+        variant=Subquery(first_variant)
+    ).order_by('sort_order', 'pk')
+    products = Product.objects.filter(card__isnull=True).annotate(
+        main_image_name=Subquery(main_image.values('image')[:1]),
+        main_image_derivatives=Subquery(main_image.values('derivatives')[:1]),
+        has_stock=Exists(ProductStock.objects.filter(variant__product=OuterRef('pk'), quantity__gt=0)),
+    )
+    storage = ProductImage._meta.get_field('image').storage
+    ProductCard.objects.bulk_create(
+        [
+            ProductCard(
+                product_id=product.pk,
+                main_image_url=storage.url(product.main_image_name) if product.main_image_name else '',
+                main_image_derivatives=product.main_image_derivatives or {},
+                effective_price=product.sale_price if product.sale_price else product.price,
+                in_stock=product.has_stock,
+            )
+            for product in products.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_login_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_cards, migrations.RunPython.noop),
+    ]
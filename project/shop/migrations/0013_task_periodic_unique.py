@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_backfill_product_cards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='periodic',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('periodic', True), ('status__in', ['pending', 'running'])), fields=('name',), name='task_periodic_unique'),
+        ),
+    ]
@@ -0,0 +1,214 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.cache import get_conditional_response
+from rest_framework import permissions, serializers
+from rest_framework.response import Response
+
+from .cache import VersionedCache, request_cache_suffix, response_etag, set_cache_headers
+
+
+class EagerPlan:
+    """План загрузки связей для сериализатора: select_related + prefetch_related"""
+
+    def __init__(self, select=(), prefetch=(), setup=None):
+        self.select = list(select)
+        # Список (путь, модель, вложенный план)
+        self.prefetch = list(prefetch)
+        # setup_eager_loading сериализатора: аннотации и прочие правки queryset
+        self.setup = setup
+
+    def add_select(self, path):
+        if path not in self.select:
+            self.select.append(path)
+
+    def add_prefetch(self, path, model, plan):
+        for existing_path, _, _ in self.prefetch:
+            if existing_path == path:
+                return
+        self.prefetch.append((path, model, plan))
+
+    def merge(self, other, prefix):
+        for path in other.select:
+            self.add_select(f'{prefix}__{path}')
+        for path, model, plan in other.prefetch:
+            self.add_prefetch(f'{prefix}__{path}', model, plan)
+
+    def lookups(self):
+        lookups = []
+        for path, model, plan in self.prefetch:
+            lookups.append(Prefetch(path, queryset=plan.apply(model._default_manager.all())))
+        return lookups
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*self.select)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.lookups())
+        if self.setup is not None:
+            queryset = self.setup(queryset)
+        return queryset
+
+
+def _relation_path(model, attrs):
+    """
+    Разбор source поля по связям модели.
+    Возвращает (путь, модель, is_many) для самой длинной цепочки связей.
+    """
+    path = []
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation:
+            break
+        path.append(attr)
+        model = field.related_model
+        if field.one_to_many or field.many_to_many:
+            return '__'.join(path), model, True
+    return '__'.join(path), model, False
+
+
+def _add_hints(plan, serializer_class, model):
+    """Подсказки из Meta для SerializerMethodField и свойств модели"""
+    meta = serializer_class.Meta
+    for path in getattr(meta, 'select_related', ()):
+        plan.add_select(path)
+    for path in getattr(meta, 'prefetch_related', ()):
+        related_model = model
+        for attr in path.split('__'):
+            related_model = related_model._meta.get_field(attr).related_model
+        plan.add_prefetch(path, related_model, EagerPlan())
+
+
+@lru_cache(maxsize=None)
+def build_eager_plan(serializer_class):
+    """Обход дерева полей сериализатора и построение плана загрузки"""
+    plan = EagerPlan(setup=getattr(serializer_class, 'setup_eager_loading', None))
+    model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    if model is None:
+        return plan
+
+    _add_hints(plan, serializer_class, model)
+    for field in serializer_class().fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        attrs = field.source.split('.')
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+        elif isinstance(field, serializers.ManyRelatedField):
+            child = None
+        elif isinstance(field, serializers.BaseSerializer):
+            child = field
+        elif isinstance(field, serializers.RelatedField):
+            if field.use_pk_only_optimization() and len(attrs) == 1:
+                # PrimaryKeyRelatedField читает только *_id
+                continue
+            child = None
+        else:
+            child = None
+            attrs = attrs[:-1]
+
+        path, related_model, is_many = _relation_path(model, attrs)
+        if not path:
+            continue
+
+        child_plan = build_eager_plan(type(child)) if child is not None else EagerPlan()
+        if is_many:
+            plan.add_prefetch(path, related_model, child_plan)
+        else:
+            plan.add_select(path)
+            plan.merge(child_plan, path)
+
+    return plan
+
+
+class EagerLoadingMixin:
+    """
+    Автоматические select_related/prefetch_related для вьюсетов
+    по дереву вложенных сериализаторов
+    """
+
+    def get_eager_plan(self, serializer_class=None):
+        return build_eager_plan(serializer_class or self.get_serializer_class())
+
+    def eager_load(self, queryset, serializer_class=None):
+        return self.get_eager_plan(serializer_class).apply(queryset)
+
+    def eager_load_object(self, instance, serializer_class=None):
+        """Догрузка связей для уже полученного объекта"""
+        plan = self.get_eager_plan(serializer_class)
+        lookups = [Prefetch(path) for path in plan.select] + plan.lookups()
+        if instance is not None and lookups:
+            prefetch_related_objects([instance], *lookups)
+        return instance
+
+    def filter_queryset(self, queryset):
+        return self.eager_load(super().filter_queryset(queryset))
+
+
+class ResponseCacheMixin:
+    """
+    Кэширование GET-ответов целиком.
+    Ключ - действие, хост, путь и нормализованные параметры запроса,
+    сброс - увеличением версии cache_namespace из сигналов моделей.
+    Ответы отдаются с ETag/Last-Modified по версии и Cache-Control: public,
+    на совпавший If-None-Match или If-Modified-Since - 304 без обращения к данным.
+    При RESPONSE_CACHE_ENABLED=False ответы строятся каждый раз, но с теми же заголовками.
+    """
+    cache_namespace = None
+
+    def get_response_cache(self):
+        return VersionedCache(self.cache_namespace)
+
+    def get_cache_suffix(self, request):
+        return request_cache_suffix(self.action, request)
+
+    def perform_authentication(self, request):
+        # Ответ каталога не зависит от пользователя: без аутентификации
+        # не читается сессия, и SessionMiddleware не добавляет Vary: Cookie
+        if request.method not in permissions.SAFE_METHODS:
+            super().perform_authentication(request)
+
+    def get_etag(self, key, request):
+        return response_etag(key, request.accepted_renderer.format)
+
+    def set_cache_headers(self, response, etag, last_modified=None):
+        return set_cache_headers(response, etag, last_modified)
+
+    def cached_response(self, request, builder):
+        cache = self.get_response_cache()
+        version = cache.get_version()
+        key = cache.format_key(self.get_cache_suffix(request), version)
+        etag = self.get_etag(key, request)
+        # Удаление товара, смена категорий и справочников не видны по датам строк,
+        # но любое изменение сбрасывает поколение: его время и есть Last-Modified
+        last_modified = cache.version_time(version)
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return self.set_cache_headers(not_modified, etag, last_modified)
+
+        response = None
+
+        def build():
+            nonlocal response
+            response = builder()
+            if response.status_code != 200:
+                return None
+            return {'data': response.data}
+
+        entry = cache.fetch(key, build)
+        if entry is None:
+            return response
+        if response is None:
+            response = Response(entry['data'])
+        return self.set_cache_headers(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ResponseCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ResponseCacheMixin, self).retrieve(request, *args, **kwargs))
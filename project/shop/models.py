@@ -1,9 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
 
+def effective_price(prefix=''):
+    """Цена товара с учётом скидки, вычисляемая в БД"""
+    return Case(
+        When(**{f'{prefix}sale_price__gt': 0}, then=F(f'{prefix}sale_price')),
+        default=F(f'{prefix}price'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
 class CustomerProfile(models.Model):
     """Прокси модель для информации о пользователе"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -28,17 +42,90 @@ class Category(models.Model):
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, related_name='children')
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, default='U')
     image = models.ImageField(upload_to='categories', null=True, blank=True)
+    # Манифест уменьшенных копий image, заполняется фоновой обработкой
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Материализованный путь от корня: "00000001/00000007/", поддерживается в save()
+    path = models.CharField(max_length=255, blank=True, default='', editable=False)
+    
+    PATH_STEP = 8
     
     class Meta:
         verbose_name_plural = 'Категории'
+        indexes = [
+            # varchar_pattern_ops - для LIKE 'путь%' в PostgreSQL
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
     
     def __str__(self):
         return self.name
     
+    @property
+    def depth(self):
+        return len(self.path) // (self.PATH_STEP + 1)
+    
+    def get_parent_path(self):
+        if not self.parent_id:
+            return ''
+        return Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+    
+    def check_parent(self, old_path, parent_path):
+        """Родитель не может лежать в поддереве самой категории"""
+        if self.parent_id == self.pk or (old_path and parent_path.startswith(old_path)):
+            raise ValidationError({'parent': 'Категория не может быть вложена в саму себя'})
+    
+    def build_path(self, parent_path):
+        return f"{parent_path}{self.pk:0{self.PATH_STEP}d}/"
+    
+    def clean(self):
+        if self.pk and self.parent_id:
+            self.check_parent(self.path, self.get_parent_path())
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        
+        # Путь и перенос поддерева - в одной транзакции с сохранением,
+        # поэтому сброс кэша в on_commit видит уже готовые пути
+        with transaction.atomic():
+            if self._state.adding or self.pk is None:
+                # pk для пути появляется только после INSERT; у новой категории
+                # ещё нет потомков, путь дописывается сразу же
+                super().save(*args, **kwargs)
+                self.path = self.build_path(self.get_parent_path())
+                Category.objects.filter(pk=self.pk).update(path=self.path)
+                return
+            
+            old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+            parent_path = self.get_parent_path()
+            self.check_parent(old_path, parent_path)
+            self.path = self.build_path(parent_path)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'path'}
+            super().save(*args, **kwargs)
+            
+            if old_path and old_path != self.path:
+                # Перенос поддерева одним UPDATE
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1))
+                )
+    
+    def get_descendants(self, include_self=True):
+        queryset = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+
+class ProductQuerySet(models.QuerySet):
+    def refresh_audience(self):
+        """Пересчёт флагов for_boys/for_girls по полу категорий одним UPDATE"""
+        def in_gender(genders):
+            return Exists(Product.categories.through.objects.filter(
+                product=OuterRef('pk'), category__gender__in=genders
+            ))
+        
+        return self.update(for_boys=in_gender(['B', 'U']), for_girls=in_gender(['G', 'U']))
 
 
 class Product(models.Model):
@@ -54,10 +141,26 @@ class Product(models.Model):
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # Заполняется shop.search
+    # Аудитория по полу категорий, поддерживается сигналами categories
+    for_boys = models.BooleanField(default=False, editable=False)
+    for_girls = models.BooleanField(default=False, editable=False)
+    
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Товары'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            # Ключи keyset-пагинации для ordering_fields каталога
+            models.Index(fields=['created_at', 'id'], name='product_created_keyset'),
+            models.Index(fields=['price', 'id'], name='product_price_keyset'),
+            models.Index(fields=['title', 'id'], name='product_title_keyset'),
+            # Витрины для мальчиков/девочек - один проход по индексу
+            models.Index(fields=['for_boys', 'is_available', 'created_at', 'id'], name='product_boys_feed'),
+            models.Index(fields=['for_girls', 'is_available', 'created_at', 'id'], name='product_girls_feed'),
+        ]
     
     def __str__(self):
         return self.title
@@ -125,6 +228,8 @@ class ProductImage(models.Model):
     """Изображение для конкрентого товара"""
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products')
+    # Манифест уменьшенных копий image, заполняется фоновой обработкой
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
     alt_text = models.CharField(max_length=255, blank=True)
     sort_order = models.PositiveIntegerField(default=0)
     
@@ -164,6 +269,20 @@ class Favorite(models.Model):
         return f"{self.user.username} - {self.product.title}"
 
 
+class CartQuerySet(models.QuerySet):
+    def with_total(self):
+        """Сумма корзины одним подзапросом"""
+        total = (
+            CartItem.objects.with_prices()
+            .filter(cart=OuterRef('pk'))
+            .order_by()
+            .values('cart')
+            .annotate(total=Sum('line_total'))
+            .values('total')
+        )
+        return self.annotate(items_total=Subquery(total, output_field=DecimalField(max_digits=12, decimal_places=2)))
+
+
 class Cart(models.Model):
     """Корзина"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart', null=True, blank=True)
@@ -171,6 +290,8 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Корзина'
     
@@ -182,12 +303,31 @@ class Cart(models.Model):
         return sum(item.get_total_price() for item in self.items.all())
 
 
+class CartItemQuerySet(models.QuerySet):
+    def with_prices(self):
+        """Цена, сумма строки и главное изображение варианта из БД"""
+        main_image = ProductImage.objects.filter(
+            variant=OuterRef('product_stock__variant')
+        ).order_by('sort_order', 'pk').values('image')[:1]
+        return self.annotate(
+            unit_price=effective_price('product_stock__variant__product__'),
+            line_total=ExpressionWrapper(
+                F('unit_price') * F('quantity'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            main_image_name=Subquery(main_image),
+        )
+
+
 class CartItem(models.Model):
     """Товары в корзине"""
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product_stock = models.ForeignKey(ProductStock, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
+    reserved_until = models.DateTimeField(null=True, blank=True, db_index=True)  # Удержание товара за корзиной
+    
+    objects = CartItemQuerySet.as_manager()
     
     class Meta:
         unique_together = [['cart', 'product_stock']]
@@ -227,6 +367,9 @@ class Order(models.Model):
 
     class Meta:
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_keyset'),
+        ]
     
     def __str__(self):
         return f"Заказ {self.id} - {self.full_name}"
@@ -242,4 +385,116 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     
     def __str__(self):
-        return f"{self.product.title} - {self.variant.color.name} - {self.size.name} x {self.quantity}"
\ No newline at end of file
+        return f"{self.product.title} - {self.variant.color.name} - {self.size.name} x {self.quantity}"
+
+
+def current_derivatives(name, manifest):
+    """Манифест копий, только если он построен для файла name"""
+    if not name or not manifest or manifest.get('source') != name:
+        return {}
+    return manifest
+
+
+class ProductCardManager(models.Manager):
+    def refresh(self, product_ids):
+        """Пересчёт карточек для указанных товаров за один проход"""
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+        
+        first_variant = ProductVariant.objects.filter(
+            product=OuterRef(OuterRef('pk'))
+        ).order_by('pk').values('pk')[:1]
+        main_image = ProductImage.objects.filter(
+            variant=Subquery(first_variant)
+        ).order_by('sort_order', 'pk')
+        products = Product.objects.filter(pk__in=product_ids).annotate(
+            main_image_name=Subquery(main_image.values('image')[:1]),
+            main_image_derivatives=Subquery(main_image.values('derivatives')[:1]),
+            has_stock=Exists(ProductStock.objects.filter(
+                variant__product=OuterRef('pk'), quantity__gt=0
+            )),
+        )
+        
+        storage = ProductImage._meta.get_field('image').storage
+        cards = [
+            ProductCard(
+                product=product,
+                main_image_url=storage.url(product.main_image_name) if product.main_image_name else '',
+                main_image_derivatives=current_derivatives(product.main_image_name, product.main_image_derivatives),
+                effective_price=product.sale_price if product.sale_price else product.price,
+                in_stock=product.has_stock,
+            )
+            for product in products
+        ]
+        self.bulk_create(
+            cards,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['main_image_url', 'main_image_derivatives', 'effective_price', 'in_stock', 'updated_at'],
+        )
+
+
+class ProductCard(models.Model):
+    """Денормализованная карточка товара для списков каталога"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='card')
+    main_image_url = models.CharField(max_length=255, blank=True)
+    main_image_derivatives = models.JSONField(default=dict, blank=True)
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2)
+    in_stock = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ProductCardManager()
+    
+    class Meta:
+        verbose_name_plural = 'Карточки товаров'
+    
+    def __str__(self):
+        return f"Карточка {self.product_id}"
+
+
+class Task(models.Model):
+    """Отложенная задача фоновой очереди (см. shop.queue)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('Ожидает')),
+        (RUNNING, _('Выполняется')),
+        (DONE, _('Выполнена')),
+        (FAILED, _('Ошибка')),
+    )
+    
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    # Запуск из settings.TASK_PERIODIC, ставится ensure_periodic
+    periodic = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    # Время выполнения последней попытки, секунды
+    duration = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_due_idx'),
+            models.Index(fields=['name', 'status'], name='task_name_status_idx'),
+        ]
+        constraints = [
+            # Одна ожидающая или выполняемая периодическая задача на имя
+            models.UniqueConstraint(
+                fields=['name'],
+                condition=models.Q(periodic=True, status__in=['pending', 'running']),
+                name='task_periodic_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,187 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (cursor) для сортировки queryset.
+    Курсор хранит значения полей сортировки последней строки, поэтому
+    страница 500 стоит столько же, сколько первая: без OFFSET и COUNT(*).
+    Для уникальности к сортировке всегда добавляется pk.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not all(isinstance(field, str) for field in ordering):
+            raise TypeError('KeysetPagination поддерживает только сортировку по именам полей')
+
+        # pk - последний ключ, после него остальные поля не нужны
+        keys = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if name in ('pk', 'id'):
+                keys.append(('pk', field.startswith('-')))
+                return keys
+            keys.append((name, field.startswith('-')))
+        descending = keys[0][1] if keys else False
+        keys.append(('pk', descending))
+        return keys
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': reverse}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return list(payload['p']), bool(payload['r'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_key_field(queryset, name):
+        """Поле модели или аннотации (например, search_rank) для ключа сортировки"""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        model = queryset.model
+        if name == 'pk':
+            return model._meta.pk
+        *path, name = name.split('__')
+        for attr in path:
+            model = model._meta.get_field(attr).related_model
+        return model._meta.get_field(name)
+
+    def clean_position(self, queryset, position):
+        """Значения курсора через to_python полей сортировки, подделанный курсор - 404"""
+        cleaned = []
+        for (name, _), value in zip(self.keys, position):
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                cleaned.append(self.get_key_field(queryset, name).to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    @staticmethod
+    def serialize_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def get_position(self, obj):
+        return [self.serialize_value(getattr(obj, name)) for name, _ in self.keys]
+
+    def keyset_filter(self, position, reverse):
+        """Лексикографическое условие (k1, k2, ...) после/до позиции"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.keys, position):
+            after = descending != reverse
+            condition |= equal & Q(**{f'{name}__{"lt" if after else "gt"}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'pagination')
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_ordering(queryset)
+
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            if len(position) != len(self.keys):
+                raise NotFound(self.invalid_cursor_message)
+            position = self.clean_position(queryset, position)
+
+        ordering = [
+            f'{"-" if descending != reverse else ""}{name}'
+            for name, descending in self.keys
+        ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else position is not None
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class ShopPagination(PageNumberPagination):
+    """
+    Постраничная пагинация по умолчанию, keyset-режим по запросу:
+    ?pagination=cursor для первой страницы, дальше по ссылкам next/previous с ?cursor=
+    """
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class(self.page_size)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_scheduler = None
+# Задачи, уже отданные пулу потоков этого процесса
+_inflight = set()
+
+
+class TaskFunction:
+    """
+    Функция, которую можно отложить: task.delay(**kwargs) или task.schedule(run_at, **kwargs).
+    Аргументы хранятся в JSON, поэтому передаются только именованные и сериализуемые.
+    """
+
+    def __init__(self, func, max_attempts=3, retry_delay=30):
+        self.func = func
+        self.max_attempts = max_attempts
+        # Задержка перед повтором (секунды), удваивается с каждой попыткой
+        self.retry_delay = retry_delay
+        self.name = f'{func.__module__}.{func.__name__}'
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, **kwargs):
+        return enqueue(self, kwargs)
+
+    def schedule(self, run_at, **kwargs):
+        return enqueue(self, kwargs, run_at=run_at)
+
+    def retry_at(self, attempts, now):
+        return now + timedelta(seconds=self.retry_delay * 2 ** max(attempts - 1, 0))
+
+
+def task(max_attempts=3, retry_delay=30):
+    """Декоратор фоновой задачи, имя задачи - путь к функции"""
+    def decorator(func):
+        return TaskFunction(func, max_attempts=max_attempts, retry_delay=retry_delay)
+    return decorator
+
+
+def enqueue(task_function, kwargs, run_at=None):
+    """
+    Запись задачи в очередь. Внутри транзакции задача появляется
+    только вместе с её данными, после фиксации.
+    """
+    queued = Task.objects.create(
+        name=task_function.name,
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=task_function.max_attempts,
+    )
+    if settings.TASK_QUEUE_MODE != 'database':
+        transaction.on_commit(lambda: dispatch(queued.pk, queued.run_at))
+    return queued
+
+
+def dispatch(task_id, run_at):
+    """Выполнение в текущем процессе: режимы thread и immediate"""
+    if settings.TASK_QUEUE_MODE == 'immediate':
+        execute(task_id)
+        return
+
+    delay = (run_at - timezone.now()).total_seconds()
+    if delay > 0:
+        timer = threading.Timer(delay, submit, [task_id])
+        timer.daemon = True
+        timer.start()
+    else:
+        submit(task_id)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.TASK_THREADS, thread_name_prefix='tasks')
+    return _executor
+
+
+def submit(task_id):
+    with _executor_lock:
+        if task_id in _inflight:
+            return
+        _inflight.add(task_id)
+    get_executor().submit(run_in_thread, task_id)
+
+
+def run_in_thread(task_id):
+    try:
+        retry_at = execute(task_id)
+    finally:
+        # У каждого потока своё соединение с БД
+        connection.close()
+        with _executor_lock:
+            _inflight.discard(task_id)
+    if retry_at is not None:
+        dispatch(task_id, retry_at)
+
+
+def start_scheduler():
+    """
+    Планировщик режима thread, запускается из wsgi.py/asgi.py.
+    Таймеры dispatch живут только в памяти процесса, поэтому планировщик
+    раз в TASK_SCHEDULER_INTERVAL забирает из БД готовые задачи - в том числе
+    повторы и отложенные задачи, оставшиеся после перезапуска, - и ставит
+    следующие запуски TASK_PERIODIC.
+    """
+    global _scheduler
+    if settings.TASK_QUEUE_MODE != 'thread':
+        return
+    with _executor_lock:
+        if _scheduler is not None:
+            return
+        _scheduler = threading.Thread(target=run_scheduler, name='tasks-scheduler', daemon=True)
+    _scheduler.start()
+
+
+def run_scheduler():
+    while True:
+        try:
+            schedule_due()
+        except Exception:
+            logger.exception('Ошибка планировщика фоновых задач')
+        finally:
+            connection.close()
+        time.sleep(settings.TASK_SCHEDULER_INTERVAL)
+
+
+def schedule_due():
+    """Один проход планировщика: периодические задачи и готовые задачи из БД в пул"""
+    ensure_periodic()
+    fail_abandoned()
+    for task_id in due_tasks(settings.TASK_THREADS * 10):
+        submit(task_id)
+
+
+def abandoned(now):
+    """running дольше TASK_STALE_AFTER: обработчик упал вместе с задачей"""
+    return Q(status=Task.RUNNING, started_at__lt=now - timedelta(seconds=settings.TASK_STALE_AFTER))
+
+
+def claimable(now):
+    """Готовые к запуску задачи и брошенные, у которых остались попытки"""
+    return Q(status=Task.PENDING, run_at__lte=now) | (abandoned(now) & Q(attempts__lt=F('max_attempts')))
+
+
+def fail_abandoned():
+    """Брошенные задачи без попыток - ошибка, иначе задача, роняющая обработчик, повторялась бы вечно"""
+    now = timezone.now()
+    return Task.objects.filter(abandoned(now), attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED,
+        finished_at=now,
+        last_error=f'Не завершилась за {settings.TASK_STALE_AFTER} с, попытки исчерпаны',
+    )
+
+
+def claim(task_id, now):
+    """Захват задачи условным UPDATE: выполнит только один обработчик"""
+    return Task.objects.filter(claimable(now), pk=task_id).update(
+        status=Task.RUNNING, started_at=now, attempts=F('attempts') + 1
+    ) == 1
+
+
+def execute(task_id):
+    """
+    Выполнение одной задачи с записью времени и результата.
+    Возвращает время повтора, если задача упала и попытки остались.
+    """
+    now = timezone.now()
+    if not claim(task_id, now):
+        return None
+    queued = Task.objects.get(pk=task_id)
+
+    func = None
+    started = time.perf_counter()
+    try:
+        func = import_string(queued.name)
+        func(**queued.kwargs)
+    except Exception:
+        duration = time.perf_counter() - started
+        logger.exception('Задача %s #%s завершилась ошибкой', queued.name, task_id)
+        fields = {'duration': duration, 'last_error': traceback.format_exc(), 'finished_at': timezone.now()}
+        # Неизвестную задачу повторять бессмысленно
+        if func is not None and queued.attempts < queued.max_attempts:
+            retry_at = func.retry_at(queued.attempts, now) if isinstance(func, TaskFunction) else now
+            Task.objects.filter(pk=task_id).update(status=Task.PENDING, run_at=retry_at, **fields)
+            return retry_at
+        Task.objects.filter(pk=task_id).update(status=Task.FAILED, **fields)
+        return None
+
+    Task.objects.filter(pk=task_id).update(
+        status=Task.DONE,
+        duration=time.perf_counter() - started,
+        finished_at=timezone.now(),
+        last_error='',
+    )
+    return None
+
+
+def due_tasks(limit):
+    return list(
+        Task.objects.filter(claimable(timezone.now()))
+        .order_by('run_at', 'pk')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+
+def ensure_periodic():
+    """
+    Следующий запуск периодических задач из settings.TASK_PERIODIC.
+    Вызывается всеми процессами одновременно: вторую ожидающую задачу
+    с тем же именем не даёт записать ограничение task_periodic_unique
+    """
+    now = timezone.now()
+    for name, interval in settings.TASK_PERIODIC.items():
+        if Task.objects.filter(name=name, status__in=[Task.PENDING, Task.RUNNING]).exists():
+            continue
+        last = Task.objects.filter(name=name).order_by('-started_at').values_list('started_at', flat=True).first()
+        func = import_string(name)
+        Task.objects.bulk_create([Task(
+            name=name,
+            periodic=True,
+            run_at=max(now, last + timedelta(seconds=interval)) if last else now,
+            max_attempts=getattr(func, 'max_attempts', 1),
+        )], ignore_conflicts=True)
+
+
+def task_stats():
+    """Время выполнения и счётчики по каждой задаче"""
+    rows = Task.objects.values('name').annotate(
+        pending=Count('pk', filter=Q(status=Task.PENDING)),
+        running=Count('pk', filter=Q(status=Task.RUNNING)),
+        done=Count('pk', filter=Q(status=Task.DONE)),
+        failed=Count('pk', filter=Q(status=Task.FAILED)),
+        retries=Count('pk', filter=Q(attempts__gt=1)),
+        avg_duration=Avg('duration', filter=Q(status=Task.DONE)),
+        max_duration=Max('duration', filter=Q(status=Task.DONE)),
+    ).order_by('name')
+    return {row.pop('name'): row for row in rows}
+
+
+@task(max_attempts=1)
+def prune_tasks():
+    """Удаление выполненных задач старше TASK_RETENTION_DAYS"""
+    cutoff = timezone.now() - timedelta(days=settings.TASK_RETENTION_DAYS)
+    Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff).delete()
@@ -0,0 +1,176 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .models import Product
+
+
+def search_tokens(term):
+    """Слова поискового запроса без служебных символов"""
+    return re.findall(r'\w+', term.lower())
+
+
+class SearchBackend:
+    """
+    Базовый полнотекстовый движок по товарам.
+    model - модель товара, в миграциях историческая
+    """
+
+    def __init__(self, model=Product):
+        self.model = model
+
+    def search(self, queryset, term):
+        """Фильтр по запросу с аннотацией search_rank (больше - релевантнее)"""
+        raise NotImplementedError
+
+    def index(self, product_ids):
+        """Обновление индекса для указанных товаров"""
+
+    def remove(self, product_ids):
+        """Удаление товаров из индекса"""
+
+    def rebuild(self, batch_size=1000):
+        product_ids = []
+        for product_id in self.model.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size):
+            product_ids.append(product_id)
+            if len(product_ids) >= batch_size:
+                self.index(product_ids)
+                product_ids = []
+        if product_ids:
+            self.index(product_ids)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector-колонка Product.search_vector с GIN-индексом и русской морфологией"""
+    config = 'russian'
+
+    def vector(self):
+        return (
+            SearchVector('title', weight='A', config=self.config)
+            + SearchVector('article', weight='A', config='simple')
+            + SearchVector('description', weight='B', config=self.config)
+            + SearchVector('composition', weight='C', config=self.config)
+        )
+
+    def query(self, term):
+        # Префиксный поиск, чтобы подсказки работали по мере набора
+        tokens = search_tokens(term)
+        if not tokens:
+            return None
+        return SearchQuery(
+            ' & '.join(f'{token}:*' for token in tokens),
+            search_type='raw',
+            config=self.config,
+        )
+
+    def search(self, queryset, term):
+        query = self.query(term)
+        if query is None:
+            return queryset.none()
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+
+    def index(self, product_ids):
+        self.model.objects.filter(pk__in=product_ids).update(search_vector=self.vector())
+
+    def rebuild(self, batch_size=1000):
+        self.model.objects.update(search_vector=self.vector())
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Виртуальная таблица FTS5 для тестов и локального запуска"""
+    table = 'shop_product_fts'
+    # Веса колонок title, article, description, composition для bm25
+    weights = (10.0, 10.0, 1.0, 0.5)
+
+    def match(self, term):
+        tokens = search_tokens(term)
+        if not tokens:
+            return None
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def search(self, queryset, term):
+        match = self.match(term)
+        if match is None:
+            return queryset.none()
+
+        weights = ', '.join(str(weight) for weight in self.weights)
+        rank = RawSQL(
+            f'SELECT -bm25({self.table}, {weights}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {self.model._meta.db_table}.id',
+            (match,),
+        )
+        matches = RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', (match,))
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+    def index(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', product_ids)
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, article, description, composition) '
+                f'SELECT id, title, article, description, composition FROM {self.model._meta.db_table} '
+                f'WHERE id IN ({placeholders})',
+                product_ids,
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', product_ids)
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    Движок из settings.SHOP_SEARCH_BACKEND или по типу БД.
+    None - полнотекстовый поиск недоступен.
+    """
+    path = getattr(settings, 'SHOP_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    backend_class = SEARCH_BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class else None
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    ?search= через полнотекстовый индекс с сортировкой по релевантности.
+    Явный ?ordering= имеет приоритет над релевантностью.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        backend = get_search_backend()
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        term = ' '.join(self.get_search_terms(request))
+        if not term:
+            return queryset
+        if not search_tokens(term):
+            return queryset.none()
+
+        queryset = backend.search(queryset, term)
+        if request.query_params.get(filters.OrderingFilter.ordering_param):
+            return queryset
+        return queryset.order_by('-search_rank', '-created_at')
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from .models import (
     CustomerProfile, Category, Product, Color, Size,
     ProductVariant, ProductImage, ProductStock,
@@ -38,10 +39,50 @@ class CustomerProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class SrcsetField(serializers.Field):
+    """
+    srcset по форматам из манифеста уменьшенных копий изображения.
+    image - поле с файлом: манифест другого (прежнего) файла не выводится
+    """
+    
+    def __init__(self, image=None, **kwargs):
+        self.image = image
+        kwargs['read_only'] = True
+        kwargs.setdefault('allow_null', True)
+        super().__init__(**kwargs)
+    
+    def get_attribute(self, instance):
+        manifest = super().get_attribute(instance)
+        if self.image is not None and manifest:
+            image = getattr(instance, self.image)
+            if not image or manifest.get('source') != image.name:
+                return None
+        return manifest
+    
+    def to_representation(self, manifest):
+        formats = (manifest or {}).get('formats')
+        if not formats:
+            return None
+        
+        request = self.context.get('request')
+        result = {}
+        for fmt, paths in formats.items():
+            candidates = []
+            for width, path in sorted(paths.items(), key=lambda item: int(item[0])):
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                candidates.append(f'{url} {width}w')
+            result[fmt] = ', '.join(candidates)
+        return result
+
+
 class CategorySerializer(serializers.ModelSerializer):
+    image_srcset = SrcsetField(source='derivatives', image='image')
+    
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'description', 'parent', 'gender', 'image']
+        fields = ['id', 'name', 'slug', 'description', 'parent', 'gender', 'image', 'image_srcset']
         read_only_fields = ['id', 'slug']
 
 
@@ -60,9 +101,11 @@ class SizeSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='derivatives', image='image')
+    
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'sort_order']
+        fields = ['id', 'image', 'srcset', 'alt_text', 'sort_order']
         read_only_fields = ['id']
 
 
@@ -98,19 +141,28 @@ class ProductVariantSerializer(serializers.ModelSerializer):
 
 class ProductListSerializer(serializers.ModelSerializer):
     main_image_url = serializers.SerializerMethodField()
+    effective_price = serializers.DecimalField(
+        source='card.effective_price', max_digits=10, decimal_places=2, read_only=True
+    )
+    in_stock = serializers.BooleanField(source='card.in_stock', read_only=True)
+    main_image_srcset = SrcsetField(source='card.main_image_derivatives')
     
     class Meta:
         model = Product
         fields = [
             'id', 'title', 'slug', 'article', 'price', 
-            'sale_price', 'main_image_url', 'is_available'
+            'sale_price', 'effective_price', 'main_image_url',
+            'main_image_srcset', 'is_available', 'in_stock'
         ]
         read_only_fields = ['id', 'slug']
+        select_related = ['card']
     
     def get_main_image_url(self, obj):
-        if obj.main_image and hasattr(obj.main_image, 'image'):
-            return obj.main_image.image.url
-        return None
+        # Карточку строит сигнал сохранения товара, без неё полей карточки нет
+        card = getattr(obj, 'card', None)
+        if card is None:
+            return None
+        return card.main_image_url or None
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
@@ -171,20 +223,36 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'product_stock', 'product_stock_id', 'quantity', 'product_info', 'added_at']
         read_only_fields = ['id', 'added_at', 'product_info']
+        select_related = ['product_stock__variant__product', 'product_stock__variant__color']
+    
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.with_prices()
     
     def get_product_info(self, obj):
         product = obj.product_stock.variant.product
         variant = obj.product_stock.variant
         size = obj.product_stock.size
         
+        if hasattr(obj, 'line_total'):
+            # Цены и изображение посчитаны в запросе (CartItemQuerySet.with_prices)
+            price = obj.unit_price
+            total_price = obj.line_total
+            image = ProductImage._meta.get_field('image').storage.url(obj.main_image_name) if obj.main_image_name else None
+        else:
+            price = product.sale_price if product.sale_price else product.price
+            total_price = obj.get_total_price()
+            first_image = variant.images.first()
+            image = first_image.image.url if first_image else None
+        
         return {
             'product_id': product.id,
             'title': product.title,
-            'price': float(product.sale_price if product.sale_price else product.price),
+            'price': float(price),
             'color': variant.color.name,
             'size': size.name,
-            'image': variant.images.first().image.url if variant.images.exists() else None,
-            'total_price': float(obj.get_total_price())
+            'image': image,
+            'total_price': float(total_price)
         }
 
 
@@ -197,7 +265,13 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'session_id', 'items', 'total_price', 'created_at', 'updated_at']
         read_only_fields = ['id', 'user', 'total_price', 'created_at', 'updated_at']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.with_total()
+    
     def get_total_price(self, obj):
+        if hasattr(obj, 'items_total'):
+            return float(obj.items_total or 0)
         return float(obj.total_price)
 
 
@@ -219,4 +293,17 @@ class OrderSerializer(serializers.ModelSerializer):
             'id', 'user', 'full_name', 'email', 'phone', 'address',
             'total_price', 'status', 'items', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'user', 'total_price', 'created_at', 'updated_at']
+
+class InventoryItemSerializer(serializers.Serializer):
+    """Строка пакетного обновления остатков: новое quantity или изменение delta"""
+    article = serializers.CharField(max_length=50)
+    color = serializers.CharField(max_length=50)
+    size = serializers.CharField(max_length=20)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    delta = serializers.IntegerField(required=False)
+    
+    def validate(self, attrs):
+        if ('quantity' in attrs) == ('delta' in attrs):
+            raise serializers.ValidationError('Нужно указать quantity или delta')
+        return attrs
@@ -0,0 +1,169 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+
+from .models import Category, Color, Size, Product, ProductVariant, ProductImage, ProductStock, ProductCard
+from rest_framework.authtoken.models import Token
+
+from .authentication import principals
+from .cache import CATALOG_CACHE_NAMESPACE, VersionedCache
+from .images import derivatives_ready, reset_derivatives, schedule_derivatives
+from .queue import task
+from .search import get_search_backend
+
+
+def schedule_card_refresh(product_ids):
+    """Пересчёт карточек товаров после фиксации транзакции"""
+    product_ids = set(product_ids)
+    transaction.on_commit(lambda: ProductCard.objects.refresh(product_ids))
+
+
+@task(max_attempts=3, retry_delay=10)
+def refresh_catalog(product_ids):
+    """Карточки и новое поколение кэша каталога после массовых изменений"""
+    ProductCard.objects.refresh(product_ids)
+    VersionedCache(CATALOG_CACHE_NAMESPACE).invalidate()
+
+
+def schedule_catalog_invalidation():
+    """
+    Новое поколение кэша каталога после фиксации транзакции.
+    Вызывается последним, чтобы карточки и поиск уже были обновлены.
+    """
+    transaction.on_commit(VersionedCache(CATALOG_CACHE_NAMESPACE).invalidate)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    schedule_card_refresh([instance.pk])
+    
+    backend = get_search_backend()
+    if backend is not None:
+        transaction.on_commit(lambda: backend.index([instance.pk]))
+    schedule_catalog_invalidation()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    backend = get_search_backend()
+    if backend is not None:
+        transaction.on_commit(lambda: backend.remove([instance.pk]))
+    schedule_catalog_invalidation()
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def variant_changed(sender, instance, **kwargs):
+    schedule_card_refresh([instance.product_id])
+    schedule_catalog_invalidation()
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductStock)
+def variant_child_changed(sender, instance, **kwargs):
+    product_id = (
+        ProductVariant.objects.filter(pk=instance.variant_id)
+        .values_list('product_id', flat=True)
+        .first()
+    )
+    if product_id is not None:
+        schedule_card_refresh([product_id])
+    schedule_catalog_invalidation()
+
+
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=Category)
+def image_changing(sender, instance, **kwargs):
+    reset_derivatives(instance)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Category)
+def image_saved(sender, instance, **kwargs):
+    schedule_derivatives(instance)
+
+
+@receiver(derivatives_ready, sender=ProductImage)
+def product_image_derivatives_ready(sender, pks, **kwargs):
+    schedule_card_refresh(
+        ProductImage.objects.filter(pk__in=pks).values_list('variant__product_id', flat=True)
+    )
+    schedule_catalog_invalidation()
+
+
+@receiver(derivatives_ready, sender=Category)
+def category_derivatives_ready(sender, pks, **kwargs):
+    transaction.on_commit(VersionedCache(REFERENCE_CACHE_NAMESPACES[Category]).invalidate)
+    schedule_catalog_invalidation()
+
+
+REFERENCE_CACHE_NAMESPACES = {
+    Category: 'categories',
+    Color: 'colors',
+    Size: 'sizes',
+}
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Color)
+@receiver([post_save, post_delete], sender=Size)
+def reference_data_changed(sender, instance, **kwargs):
+    cache = VersionedCache(REFERENCE_CACHE_NAMESPACES[sender])
+    transaction.on_commit(cache.invalidate)
+    # Категории, цвета и размеры выводятся и в карточках товаров
+    schedule_catalog_invalidation()
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # После clear() со стороны категории список товаров уже не получить
+        instance._cleared_product_ids = list(instance.products.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = instance.__dict__.pop('_cleared_product_ids', [])
+    else:
+        product_ids = pk_set or []
+    Product.objects.filter(pk__in=product_ids).refresh_audience()
+    schedule_catalog_invalidation()
+
+
+@receiver(post_save, sender=Category)
+def category_gender_changed(sender, instance, created, **kwargs):
+    if not created:
+        Product.objects.filter(categories=instance).refresh_audience()
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    instance._deleted_product_ids = list(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    product_ids = instance.__dict__.pop('_deleted_product_ids', [])
+    transaction.on_commit(lambda: Product.objects.filter(pk__in=product_ids).refresh_audience())
+    schedule_catalog_invalidation()
+
+
+def schedule_principal_revoke(user_id):
+    """Сброс пользователя в кэше аутентификации после фиксации транзакции"""
+    transaction.on_commit(lambda: principals.revoke(user_id))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Вход обновляет только last_login, кэш от него не устаревает
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    schedule_principal_revoke(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    schedule_principal_revoke(instance.user_id)
@@ -0,0 +1,195 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import CartItem, ProductCard, ProductStock
+from .queue import task
+from .signals import refresh_catalog, schedule_catalog_invalidation
+
+
+class InsufficientStock(Exception):
+    """Недостаточно товара на складе"""
+    
+    def __init__(self, product_stock_ids):
+        self.product_stock_ids = list(product_stock_ids)
+        super().__init__('Недостаточно товара на складе')
+
+
+def hold_deadline():
+    """Срок удержания товара в корзине, None - удержание отключено"""
+    minutes = getattr(settings, 'CART_HOLD_MINUTES', 0)
+    if not minutes:
+        return None
+    return timezone.now() + timedelta(minutes=minutes)
+
+
+def held_quantities(product_stock_ids, exclude_cart=None):
+    """Количество, удерживаемое активными корзинами, по единицам учёта"""
+    if not getattr(settings, 'CART_HOLD_MINUTES', 0):
+        return {}
+    
+    holds = CartItem.objects.filter(
+        product_stock_id__in=product_stock_ids,
+        reserved_until__gt=timezone.now(),
+    )
+    if exclude_cart is not None:
+        holds = holds.exclude(cart=exclude_cart)
+    return dict(
+        holds.order_by()
+        .values('product_stock_id')
+        .annotate(total=Sum('quantity'))
+        .values_list('product_stock_id', 'total')
+    )
+
+
+def lock_stock(product_stock_ids):
+    """
+    Блокировка строк ProductStock до конца транзакции.
+    Строки блокируются в порядке pk, чтобы параллельные заказы не ловили deadlock.
+    """
+    return list(
+        ProductStock.objects.select_for_update()
+        .filter(pk__in=product_stock_ids)
+        .order_by('pk')
+    )
+
+
+def check_available(cart, product_stock, quantity):
+    """Проверка, что корзина может удерживать quantity единиц товара"""
+    held = held_quantities([product_stock.pk], exclude_cart=cart)
+    if quantity > product_stock.quantity - held.get(product_stock.pk, 0):
+        raise InsufficientStock([product_stock.pk])
+
+
+def consume_stock(cart, lines):
+    """
+    Списание товара при оформлении заказа, вызывается внутри транзакции.
+    lines - пары (product_stock_id, quantity).
+    """
+    required = {}
+    for product_stock_id, quantity in lines:
+        required[product_stock_id] = required.get(product_stock_id, 0) + quantity
+    
+    stocks = lock_stock(required)
+    held = held_quantities(required, exclude_cart=cart)
+    
+    missing = [
+        stock.pk for stock in stocks
+        if required[stock.pk] > stock.quantity - held.get(stock.pk, 0)
+    ]
+    missing += [pk for pk in required if pk not in {stock.pk for stock in stocks}]
+    if missing:
+        raise InsufficientStock(missing)
+    
+    for stock in stocks:
+        stock.quantity -= required[stock.pk]
+    ProductStock.objects.bulk_update(stocks, ['quantity'])
+    
+    # bulk_update не отправляет post_save, карточки обновляет фоновая задача
+    refresh_catalog.delay(product_ids=list(
+        ProductStock.objects.filter(pk__in=required)
+        .values_list('variant__product_id', flat=True)
+        .distinct()
+    ))
+
+
+def update_quantities(quantities, batch_size=500):
+    """
+    Запись остатков {pk: quantity} одним UPDATE ... FROM (VALUES ...) на пачку.
+    bulk_update собирает CASE WHEN на каждую строку и на тысячах строк
+    медленнее самого запроса. Без UPDATE ... FROM (MySQL) - bulk_update.
+    """
+    items = list(quantities.items())
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        ProductStock.objects.bulk_update(
+            [ProductStock(pk=pk, quantity=quantity) for pk, quantity in items], ['quantity'], batch_size=batch_size
+        )
+        return
+    
+    table = connection.ops.quote_name(ProductStock._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            values = ', '.join(['(%s, %s)'] * len(batch))
+            cursor.execute(
+                f'WITH v (id, quantity) AS (VALUES {values}) '
+                f'UPDATE {table} SET quantity = v.quantity FROM v WHERE {table}.id = v.id',
+                [param for row in batch for param in row],
+            )
+
+
+def stock_key(article, color, size):
+    return article, color.lower(), size.lower()
+
+
+def apply_inventory(rows, atomic=False):
+    """
+    Пакетное обновление остатков по (артикул, цвет, размер).
+    rows - dict с quantity (новое значение) или delta (изменение),
+    строки для одной единицы учёта применяются по порядку.
+    Поиск - один запрос с join и блокировкой строк, запись - update_quantities,
+    карточки товаров пересчитываются одним проходом.
+    При atomic=True ошибка в любой строке отменяет всё.
+    Возвращает (результаты по строкам, применены ли изменения).
+    """
+    with transaction.atomic():
+        stocks = ProductStock.objects.filter(
+            variant__product__article__in={row['article'] for row in rows}
+        ).order_by('pk')
+        # Блокируются только остатки, не товары и справочники
+        if connection.features.has_select_for_update_of:
+            stocks = stocks.select_for_update(of=('self',))
+        else:
+            stocks = stocks.select_for_update()
+        found = {
+            stock_key(article, color, size): [pk, quantity, product_id]
+            for pk, quantity, product_id, article, color, size in stocks.values_list(
+                'pk', 'quantity', 'variant__product_id',
+                'variant__product__article', 'variant__color__name', 'size__name',
+            )
+        }
+        
+        results = []
+        changed = {}
+        for index, row in enumerate(rows):
+            stock = found.get(stock_key(row['article'], row['color'], row['size']))
+            if stock is None:
+                results.append({'index': index, 'status': 'not_found'})
+                continue
+            
+            pk, current, product_id = stock
+            quantity = row['quantity'] if row.get('quantity') is not None else current + row['delta']
+            if quantity < 0:
+                results.append({
+                    'index': index, 'status': 'invalid', 'product_stock': pk,
+                    'error': f'Остаток не может быть отрицательным: {quantity}',
+                })
+                continue
+            
+            if quantity != current:
+                stock[1] = quantity
+                changed[pk] = stock
+            results.append({'index': index, 'status': 'ok', 'product_stock': pk, 'quantity': quantity})
+        
+        failed = any(result['status'] != 'ok' for result in results)
+        if atomic and failed:
+            transaction.set_rollback(True)
+            return results, False
+        
+        if changed:
+            update_quantities({pk: quantity for pk, quantity, product_id in changed.values()})
+            # Запись в обход модели не отправляет сигналы: наличие в карточках пересчитывается здесь
+            ProductCard.objects.refresh({product_id for pk, quantity, product_id in changed.values()})
+            schedule_catalog_invalidation()
+    return results, True
+
+
+@task(max_attempts=1)
+def release_expired_holds(now=None):
+    """Снятие истёкших удержаний одним запросом"""
+    return CartItem.objects.filter(
+        reserved_until__lte=now or timezone.now()
+    ).update(reserved_until=None)
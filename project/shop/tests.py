@@ -1,3 +1,1143 @@
-from django.test import TestCase
+import base64
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import checks, queue
+from .authentication import principals
+from .cache import VersionedCache
+from .catalog_import import CatalogImporter
+from .checkout import CheckoutError, place_order
+from .models import (
+    Category, CustomerProfile, Product, Color, Size, ProductVariant, ProductStock,
+    Cart, CartItem, Order, OrderItem, ProductCard, ProductImage, Task
+)
+from .mixins import build_eager_plan
+from .search import get_search_backend
+from .serializers import CategorySerializer, OrderSerializer, ProductImageSerializer
+from .stock import consume_stock, hold_deadline
+
+
+def create_product(article, price=1000, sale_price=None, quantity=5, category=None):
+    """Товар с одним вариантом и одним размером"""
+    product = Product.objects.create(
+        title=f'Товар {article}', slug=article.lower(), article=article,
+        price=price, sale_price=sale_price, description='-'
+    )
+    if category is not None:
+        product.categories.add(category)
+    color, _ = Color.objects.get_or_create(name='Red', defaults={'code': '#f00'})
+    size, _ = Size.objects.get_or_create(name='M')
+    variant = ProductVariant.objects.create(product=product, color=color, is_default=True)
+    ProductStock.objects.create(variant=variant, size=size, quantity=quantity)
+    return product
+
+
+class ShopTestCase(TestCase):
+    """Общая подготовка: пустые кэши и API-клиент"""
+    
+    def setUp(self):
+        for alias in caches:
+            caches[alias].clear()
+        self.client = APIClient()
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ParallelCheckoutStressTest(TransactionTestCase):
+    """Параллельные заказы одной единицы учёта не должны уводить склад в минус"""
+    buyers = 40
+    in_stock = 15
+
+    def setUp(self):
+        category = Category.objects.create(name='Girls', slug='girls', gender='G')
+        product = Product.objects.create(
+            title='Платье', slug='dress', article='D-1', price=1000, description='-'
+        )
+        product.categories.add(category)
+        variant = ProductVariant.objects.create(
+            product=product, color=Color.objects.create(name='Red', code='#f00')
+        )
+        self.stock = ProductStock.objects.create(
+            variant=variant, size=Size.objects.create(name='M'), quantity=self.in_stock
+        )
+
+        self.users = []
+        for i in range(self.buyers):
+            user = User.objects.create_user(f'buyer{i}', password='-')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product_stock=self.stock, quantity=1)
+            self.users.append(user)
+
+    def checkout(self, user):
+        try:
+            serializer = OrderSerializer(data={
+                'full_name': user.username, 'email': 'buyer@example.com',
+                'phone': '-', 'address': '-',
+            })
+            serializer.is_valid(raise_exception=True)
+            place_order(user, serializer)
+            return True
+        except CheckoutError:
+            return False
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(self.checkout, self.users))
+
+        self.stock.refresh_from_db()
+        self.assertEqual(results.count(True), self.in_stock)
+        self.assertEqual(Order.objects.count(), self.in_stock)
+        self.assertEqual(self.stock.quantity, 0)
+
+
+class ProductCardTest(ShopTestCase):
+    """Список товаров читает цену, наличие и фото из карточки"""
+    
+    def test_list_reads_card(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('A-1', price=1000, sale_price=800)
+            create_product('A-2', price=500, quantity=0)
+        ProductCard.objects.filter(product__article='A-1').update(effective_price=700)
+        
+        response = self.client.get('/api/products/')
+        
+        self.assertEqual(response.status_code, 200)
+        items = {item['article']: item for item in response.json()['results']}
+        self.assertEqual(items['A-1']['effective_price'], '700.00')
+        self.assertTrue(items['A-1']['in_stock'])
+        self.assertFalse(items['A-2']['in_stock'])
+    
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_missing_card_does_not_query(self):
+        create_product('A-1')
+        for i in range(5):
+            create_product(f'B-{i}')
+        
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/products/')
+        
+        for item in response.json()['results']:
+            self.assertIsNone(item['effective_price'])
+            self.assertIsNone(item['main_image_url'])
+
+
+class EagerLoadingTest(ShopTestCase):
+    """План загрузки из дерева сериализатора: число запросов не зависит от числа строк"""
+    
+    def order_list_queries(self, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def test_plan_from_nested_serializers(self):
+        plan = build_eager_plan(OrderSerializer)
+        
+        prefetched = [path for path, _, _ in plan.prefetch]
+        self.assertEqual(prefetched, ['items'])
+        item_plan = plan.prefetch[0][2]
+        self.assertIn('product__card', item_plan.select)
+    
+    def test_order_list_queries_are_constant(self):
+        user = User.objects.create_user('buyer', password='-')
+        products = [create_product(f'A-{i}') for i in range(6)]
+        
+        def add_order(items):
+            order = Order.objects.create(
+                user=user, full_name='-', email='a@a.com', phone='-', address='-', total_price=0
+            )
+            for product in items:
+                variant = product.variants.get()
+                OrderItem.objects.create(
+                    order=order, product=product, variant=variant,
+                    size=variant.stocks.get().size, price=product.price
+                )
+        
+        add_order(products[:1])
+        baseline = self.order_list_queries(user)
+        add_order(products)
+        add_order(products[2:])
+        self.assertEqual(self.order_list_queries(user), baseline)
+
+
+class CurrentCartTest(ShopTestCase):
+    """Текущая корзина: цены и суммы считаются в БД"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer', password='-')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+    
+    def add(self, product, quantity):
+        stock = ProductStock.objects.get(variant__product=product)
+        CartItem.objects.create(cart=self.cart, product_stock=stock, quantity=quantity)
+    
+    def test_totals(self):
+        self.add(create_product('A-1', price=1000, sale_price=800), 2)
+        self.add(create_product('A-2', price=300), 1)
+        
+        response = self.client.get('/api/carts/current/')
+        
+        data = response.json()
+        self.assertEqual(data['total_price'], 1900.0)
+        lines = {item['product_info']['title']: item['product_info'] for item in data['items']}
+        self.assertEqual(lines['Товар A-1']['price'], 800.0)
+        self.assertEqual(lines['Товар A-1']['total_price'], 1600.0)
+    
+    def test_queries_are_constant(self):
+        self.add(create_product('A-1'), 1)
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get('/api/carts/current/')
+        for i in range(5):
+            self.add(create_product(f'B-{i}'), 1)
+        
+        with self.assertNumQueries(len(baseline)):
+            self.client.get('/api/carts/current/')
+
+
+class PlaceOrderTest(ShopTestCase):
+    """Оформление заказа из корзины в одной транзакции"""
+    
+    order_data = {'full_name': 'Покупатель', 'email': 'a@a.com', 'phone': '-', 'address': '-'}
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer', password='-')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+    
+    def add(self, product, quantity):
+        stock = ProductStock.objects.get(variant__product=product)
+        CartItem.objects.create(cart=self.cart, product_stock=stock, quantity=quantity)
+        return stock
+    
+    def test_order_from_cart(self):
+        first = self.add(create_product('A-1', price=1000, sale_price=800), 2)
+        second = self.add(create_product('A-2', price=300), 3)
+        
+        response = self.client.post('/api/orders/', self.order_data)
+        
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, 2500)
+        self.assertEqual(
+            sorted(order.items.values_list('price', 'quantity')),
+            [(300, 3), (800, 2)],
+        )
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.quantity, second.quantity), (3, 2))
+    
+    def test_line_added_during_checkout_kept(self):
+        self.add(create_product('A-1'), 1)
+        late = ProductStock.objects.get(variant__product=create_product('A-2'))
+        
+        def add_late_line(cart, rows):
+            CartItem.objects.create(cart=cart, product_stock=late, quantity=1)
+            return consume_stock(cart, rows)
+        
+        with mock.patch('shop.checkout.consume_stock', side_effect=add_late_line):
+            response = self.client.post('/api/orders/', self.order_data)
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().items.count(), 1)
+        self.assertEqual(list(self.cart.items.values_list('product_stock', flat=True)), [late.pk])
+    
+    def test_empty_cart(self):
+        response = self.client.post('/api/orders/', self.order_data)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+    
+    def test_queries_do_not_grow_with_lines(self):
+        self.add(create_product('A-1'), 1)
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.post('/api/orders/', self.order_data)
+        for i in range(5):
+            self.add(create_product(f'B-{i}'), 1)
+        
+        with self.assertNumQueries(len(baseline)):
+            self.client.post('/api/orders/', self.order_data)
+
+
+@override_settings(CART_HOLD_MINUTES=15)
+class StockReservationTest(ShopTestCase):
+    """Добавление в корзину и заказ не превышают остаток с учётом удержаний"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer', password='-')
+        self.client.force_authenticate(self.user)
+        self.stock = ProductStock.objects.get(variant__product=create_product('A-1', quantity=5))
+    
+    def test_add_over_stock(self):
+        response = self.client.post('/api/cart-items/', {'product_stock_id': self.stock.pk, 'quantity': 6})
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['product_stock_ids'], [self.stock.pk])
+    
+    def test_other_carts_hold_stock(self):
+        other = Cart.objects.create(user=User.objects.create_user('other', password='-'))
+        CartItem.objects.create(
+            cart=other, product_stock=self.stock, quantity=4, reserved_until=hold_deadline()
+        )
+        
+        response = self.client.post('/api/cart-items/', {'product_stock_id': self.stock.pk, 'quantity': 2})
+        
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/cart-items/', {'product_stock_id': self.stock.pk, 'quantity': 1})
+        self.assertEqual(response.status_code, 201)
+    
+    def test_order_over_stock(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product_stock=self.stock, quantity=5)
+        ProductStock.objects.filter(pk=self.stock.pk).update(quantity=3)
+        
+        response = self.client.post(
+            '/api/orders/', {'full_name': '-', 'email': 'a@a.com', 'phone': '-', 'address': '-'}
+        )
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['product_stock_ids'], [self.stock.pk])
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 3)
+
+
+class CartMergeTest(ShopTestCase):
+    """Слияние корзины анонима с корзиной пользователя после входа"""
+    
+    def setUp(self):
+        super().setUp()
+        session = self.client.session
+        session.save()
+        self.anonymous_cart = Cart.objects.create(session_id=session.session_key)
+        self.user = User.objects.create_user('buyer', password='-')
+        self.client.force_authenticate(self.user)
+        self.first = ProductStock.objects.get(variant__product=create_product('A-1', quantity=5))
+        self.second = ProductStock.objects.get(variant__product=create_product('A-2', quantity=5))
+    
+    def test_quantities_are_summed(self):
+        user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=user_cart, product_stock=self.first, quantity=2)
+        CartItem.objects.create(cart=self.anonymous_cart, product_stock=self.first, quantity=3)
+        CartItem.objects.create(cart=self.anonymous_cart, product_stock=self.second, quantity=1)
+        
+        response = self.client.post('/api/carts/merge/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(CartItem.objects.filter(cart=user_cart).values_list('product_stock_id', 'quantity')),
+            {self.first.pk: 5, self.second.pk: 1},
+        )
+        self.assertEqual(Cart.objects.count(), 1)
+        
+        response = self.client.post('/api/carts/merge/')
+        self.assertEqual(response.json(), {'message': 'Нет добавленных товаров'})
+    
+    def test_creates_user_cart(self):
+        CartItem.objects.create(cart=self.anonymous_cart, product_stock=self.first, quantity=3)
+        
+        self.client.post('/api/carts/merge/')
+        
+        cart = Cart.objects.get()
+        self.assertEqual(cart.user, self.user)
+        self.assertEqual(cart.items.get().quantity, 3)
+    
+    def test_merge_over_stock(self):
+        user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=user_cart, product_stock=self.first, quantity=4)
+        CartItem.objects.create(cart=self.anonymous_cart, product_stock=self.first, quantity=2)
+        CartItem.objects.create(cart=self.anonymous_cart, product_stock=self.second, quantity=1)
+        
+        response = self.client.post('/api/carts/merge/')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['product_stock_ids'], [self.first.pk])
+        # Ничего не записано, анонимная корзина осталась для следующей попытки
+        self.assertEqual(self.anonymous_cart.items.count(), 2)
+        self.assertEqual(user_cart.items.get().quantity, 4)
+
+
+class ProductSearchTest(ShopTestCase):
+    """?search= по полнотекстовому индексу с ранжированием"""
+    
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('A-1')
+            Product.objects.filter(article='A-1').update(title='Носки', description='К платью')
+            dress = create_product('A-2')
+            dress.title = 'Платье летнее'
+            dress.save()
+            create_product('A-3')
+    
+    def search(self, term):
+        response = self.client.get('/api/products/', {'search': term})
+        return [item['article'] for item in response.json()['results']]
+    
+    def test_prefix_and_rank(self):
+        get_search_backend().index(Product.objects.values_list('pk', flat=True))
+        
+        self.assertEqual(self.search('плать'), ['A-2', 'A-1'])
+    
+    def test_index_follows_saves(self):
+        self.assertEqual(self.search('летнее'), ['A-2'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(article='A-2').delete()
+        
+        self.assertEqual(self.search('летнее'), [])
+    
+    def test_article_and_empty_terms(self):
+        self.assertEqual(self.search('a-3'), ['A-3'])
+        self.assertEqual(self.search('!!!'), [])
+
+
+class ProductFacetsTest(ShopTestCase):
+    """Счётчики фильтров по текущей выборке, кэш в поколении каталога"""
+    
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Girls', slug='girls', gender='G')
+        create_product('A-1', price=500, category=self.category)
+        create_product('A-2', price=1500, quantity=0, category=self.category)
+        create_product('A-3', price=2500)
+    
+    def test_counts(self):
+        data = self.client.get('/api/products/facets/').json()
+        
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([row['count'] for row in data['categories']], [2])
+        self.assertEqual([row['count'] for row in data['sizes']], [2])
+        self.assertEqual([row['count'] for row in data['price'][:3]], [1, 1, 1])
+        
+        data = self.client.get('/api/products/facets/', {'categories': self.category.pk}).json()
+        self.assertEqual(data['count'], 2)
+    
+    def test_invalidated_with_catalog(self):
+        self.assertEqual(self.client.get('/api/products/facets/').json()['count'], 3)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('A-4')
+        
+        self.assertEqual(self.client.get('/api/products/facets/').json()['count'], 4)
+
+
+class KeysetPaginationTest(ShopTestCase):
+    """?pagination=cursor: страницы по ключу сортировки, подделанный курсор - 404"""
+    
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            create_product(f'A-{i}')
+    
+    @staticmethod
+    def cursor(payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+    
+    def test_pages(self):
+        seen = []
+        url = '/api/products/?pagination=cursor&page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(item['article'] for item in data['results'])
+            url = data['next']
+        
+        self.assertEqual(sorted(seen), [f'A-{i}' for i in range(5)])
+        self.assertEqual(len(set(seen)), 5)
+    
+    def test_previous(self):
+        first = self.client.get('/api/products/', {'pagination': 'cursor', 'page_size': 2}).json()
+        second = self.client.get(first['next']).json()
+        
+        back = self.client.get(second['previous']).json()
+        
+        self.assertEqual(back['results'], first['results'])
+    
+    def test_tampered_cursor(self):
+        for payload in ({'p': ['notadate', 1], 'r': False}, {'p': ['2026-01-01T00:00:00', 'x'], 'r': False},
+                        {'p': [None, 1], 'r': False}, {'p': [1], 'r': False}, {'x': 1}):
+            response = self.client.get('/api/products/', {'cursor': self.cursor(payload)})
+            self.assertEqual(response.status_code, 404, payload)
+        
+        response = self.client.get('/api/products/', {'cursor': 'not-base64!'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CategoryTreeTest(ShopTestCase):
+    """Материализованный путь категорий и выборки по поддереву"""
+    
+    def setUp(self):
+        super().setUp()
+        self.root = Category.objects.create(name='Одежда', slug='clothes')
+        self.child = Category.objects.create(name='Платья', slug='dresses', parent=self.root)
+        self.leaf = Category.objects.create(name='Летние', slug='summer', parent=self.child)
+        self.other = Category.objects.create(name='Обувь', slug='shoes')
+    
+    def test_paths(self):
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'{self.root.pk:08d}/{self.child.pk:08d}/{self.leaf.pk:08d}/')
+        self.assertEqual(self.leaf.depth, 3)
+    
+    def test_move_subtree(self):
+        self.child.parent = self.other
+        self.child.save()
+        
+        self.leaf.refresh_from_db()
+        self.assertTrue(self.leaf.path.startswith(self.other.path))
+        self.assertEqual(list(self.root.get_descendants(include_self=False)), [])
+    
+    def test_cycle_is_rejected_on_save(self):
+        self.root.parent = self.leaf
+        with self.assertRaises(ValidationError):
+            self.root.save()
+        
+        self.root.parent = self.root
+        with self.assertRaises(ValidationError):
+            self.root.save()
+        self.root.refresh_from_db()
+        self.assertIsNone(self.root.parent_id)
+    
+    def test_tree_and_subtree_filter(self):
+        create_product('A-1', category=self.leaf)
+        create_product('A-2', category=self.other)
+        
+        tree = self.client.get('/api/categories/tree/').json()
+        self.assertEqual([node['slug'] for node in tree], ['shoes', 'clothes'])
+        self.assertEqual(tree[1]['children'][0]['children'][0]['slug'], 'summer')
+        
+        response = self.client.get('/api/products/', {'category_tree': 'clothes'})
+        self.assertEqual([item['article'] for item in response.json()['results']], ['A-1'])
+
+
+class ProductAudienceTest(ShopTestCase):
+    """Флаги for_boys/for_girls следуют за категориями товара"""
+    
+    def setUp(self):
+        super().setUp()
+        self.boys = Category.objects.create(name='Boys', slug='boys', gender='B')
+        self.girls = Category.objects.create(name='Girls', slug='girls', gender='G')
+        self.product = create_product('A-1', category=self.boys)
+    
+    def audience(self):
+        self.product.refresh_from_db()
+        return self.product.for_boys, self.product.for_girls
+    
+    def test_follows_categories(self):
+        self.assertEqual(self.audience(), (True, False))
+        
+        self.product.categories.add(self.girls)
+        self.assertEqual(self.audience(), (True, True))
+        
+        self.boys.products.clear()
+        self.assertEqual(self.audience(), (False, True))
+    
+    def test_follows_category_gender(self):
+        self.boys.gender = 'U'
+        self.boys.save()
+        
+        self.assertEqual(self.audience(), (True, True))
+    
+    def test_feeds(self):
+        create_product('A-2', category=self.girls)
+        
+        boys = self.client.get('/api/products/boys/').json()['results']
+        girls = self.client.get('/api/products/girls/').json()['results']
+        
+        self.assertEqual([item['article'] for item in boys], ['A-1'])
+        self.assertEqual([item['article'] for item in girls], ['A-2'])
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTest(ShopTestCase):
+    """Кэш ответов каталога и справочников по поколениям, ETag и 304"""
+    
+    def setUp(self):
+        super().setUp()
+        create_product('A-1')
+    
+    def test_cached_until_invalidated(self):
+        first = self.client.get('/api/products/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/')
+        self.assertEqual(second.json(), first.json())
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product('A-2')
+        
+        third = self.client.get('/api/products/')
+        self.assertEqual(third.json()['count'], 2)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+    
+    def test_not_modified(self):
+        response = self.client.get('/api/colors/')
+        self.assertIn('public', response['Cache-Control'])
+        
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/colors/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Color.objects.create(name='Blue', code='#00f')
+        response = self.client.get('/api/colors/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+    
+    @override_settings(RESPONSE_CACHE_ENABLED=True, PROCESS_CACHE_TIMEOUT=30)
+    def test_process_cache_timeout(self):
+        self.assertEqual(VersionedCache('colors', 3600).get_timeout(), 30)
+        self.client.get('/api/colors/')
+        
+        with self.assertNumQueries(0):
+            self.client.get('/api/colors/')
+        
+        version_key = VersionedCache('colors').version_key
+        with mock.patch('time.time', return_value=time.time() + 31):
+            self.assertIsNone(caches['default'].get(version_key))
+    
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_disabled(self):
+        first = self.client.get('/api/products/')
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/')
+        
+        self.assertTrue(queries)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertIn('public', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ProductDetailCacheTest(ShopTestCase):
+    """Карточка и варианты товара из кэша до изменения каталога"""
+    
+    def setUp(self):
+        super().setUp()
+        self.product = create_product('A-1', quantity=5)
+        self.stock = ProductStock.objects.get(variant__product=self.product)
+    
+    def quantity(self, data):
+        return data['variants'][0]['stocks'][0]['quantity']
+    
+    def test_detail_follows_stock(self):
+        url = f'/api/products/{self.product.pk}/'
+        self.assertEqual(self.quantity(self.client.get(url).json()), 5)
+        
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.quantity = 2
+            self.stock.save()
+        
+        self.assertEqual(self.quantity(self.client.get(url).json()), 2)
+    
+    def test_variants_and_missing_product(self):
+        url = f'/api/products/{self.product.pk}/variants/'
+        self.assertEqual(len(self.client.get(url).json()), 1)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        
+        # 404 не кэшируется
+        self.assertEqual(self.client.get('/api/products/0/variants/').status_code, 404)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/0/variants/')
+        self.assertTrue(queries)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class LastModifiedTest(ShopTestCase):
+    """Last-Modified - время сброса поколения: удаление и справочники тоже его меняют"""
+    
+    def setUp(self):
+        super().setUp()
+        self.product = create_product('A-1')
+        create_product('A-2')
+    
+    def get(self, url, since):
+        return self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+    
+    def test_not_modified(self):
+        response = self.client.get('/api/products/')
+        
+        with self.assertNumQueries(0):
+            response = self.get('/api/products/', response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_product_deleted(self):
+        since = http_date(time.time() + 1)
+        # Сброс через несколько секунд: Last-Modified с точностью до секунды
+        later = time.time_ns() + 5 * 10 ** 9
+        self.assertEqual(self.get('/api/products/', since).status_code, 304)
+        
+        with mock.patch('time.time_ns', return_value=later), self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(article='A-2').delete()
+        
+        response = self.get('/api/products/', since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+    
+    def test_reference_renamed(self):
+        url = f'/api/products/{self.product.pk}/'
+        since = http_date(time.time() + 1)
+        # Сброс через несколько секунд: Last-Modified с точностью до секунды
+        later = time.time_ns() + 5 * 10 ** 9
+        self.assertEqual(self.get(url, since).status_code, 304)
+        
+        with mock.patch('time.time_ns', return_value=later), self.captureOnCommitCallbacks(execute=True):
+            Color.objects.update_or_create(name='Red', defaults={'name': 'Crimson'})
+        
+        response = self.get(url, since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['variants'][0]['color']['name'], 'Crimson')
+
+
+@queue.task(max_attempts=2, retry_delay=10)
+def failing_task():
+    raise ValueError('сбой')
+
+
+class TaskSchedulerTest(ShopTestCase):
+    """Планировщик режима thread: периодические задачи и задачи из БД после перезапуска"""
+    
+    @override_settings(TASK_PERIODIC={'shop.queue.prune_tasks': 3600})
+    def test_schedule_due(self):
+        now = timezone.now()
+        overdue = Task.objects.create(name='shop.queue.prune_tasks', run_at=now - timedelta(minutes=1))
+        later = Task.objects.create(name='shop.stock.release_expired_holds', run_at=now + timedelta(hours=1))
+        
+        with mock.patch('shop.queue.submit') as submit:
+            queue.schedule_due()
+        
+        submitted = [call.args[0] for call in submit.call_args_list]
+        self.assertIn(overdue.pk, submitted)
+        self.assertNotIn(later.pk, submitted)
+        # prune_tasks уже ждёт запуска, второй раз не ставится
+        self.assertEqual(Task.objects.filter(name='shop.queue.prune_tasks').count(), 1)
+    
+    @override_settings(TASK_PERIODIC={'shop.queue.prune_tasks': 3600})
+    def test_periodic_next_run(self):
+        started = timezone.now() - timedelta(minutes=10)
+        Task.objects.create(
+            name='shop.queue.prune_tasks', run_at=started, started_at=started, status=Task.DONE
+        )
+        
+        queue.ensure_periodic()
+        
+        pending = Task.objects.get(status=Task.PENDING)
+        self.assertEqual(pending.run_at, started + timedelta(seconds=3600))
+    
+    @override_settings(TASK_QUEUE_MODE='database')
+    def test_failed_task_is_retried(self):
+        queued = failing_task.delay()
+        
+        with self.assertLogs('shop.queue', 'ERROR'):
+            retry_at = queue.execute(queued.pk)
+        
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.run_at), (Task.PENDING, 1, retry_at))
+        self.assertIn('ValueError', queued.last_error)
+        self.assertEqual(queue.due_tasks(10), [])
+    
+    @override_settings(TASK_STALE_AFTER=60)
+    def test_abandoned_task_attempts(self):
+        started = timezone.now() - timedelta(minutes=5)
+        retry = Task.objects.create(
+            name='shop.queue.prune_tasks', status=Task.RUNNING, run_at=started, started_at=started,
+            attempts=1, max_attempts=2,
+        )
+        exhausted = Task.objects.create(
+            name='shop.queue.prune_tasks', status=Task.RUNNING, run_at=started, started_at=started,
+            attempts=2, max_attempts=2,
+        )
+        
+        self.assertEqual(queue.due_tasks(10), [retry.pk])
+        self.assertEqual(queue.fail_abandoned(), 1)
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, Task.FAILED)
+        self.assertFalse(queue.claim(exhausted.pk, timezone.now()))
+    
+    @override_settings(TASK_PERIODIC={'shop.queue.prune_tasks': 3600})
+    def test_periodic_race(self):
+        queue.ensure_periodic()
+        # Второй процесс не увидел задачу первого
+        with mock.patch('django.db.models.QuerySet.exists', return_value=False):
+            queue.ensure_periodic()
+        
+        self.assertEqual(Task.objects.filter(name='shop.queue.prune_tasks').count(), 1)
+
+
+class AnonymousCartTest(ShopTestCase):
+    """Корзина анонима: чтение без записи, сессия переживает очистку кэша"""
+    
+    def test_read_without_session(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/carts/current/')
+        
+        self.assertEqual(response.json()['items'], [])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cart-items/')
+        self.assertEqual(response.json()['results'], [])
+    
+    def test_session_survives_cache_eviction(self):
+        session = self.client.session
+        session.save()
+        cart = Cart.objects.create(session_id=session.session_key)
+        stock = ProductStock.objects.get(variant__product=create_product('A-1'))
+        CartItem.objects.create(cart=cart, product_stock=stock, quantity=2)
+        
+        caches['default'].clear()
+        self.assertTrue(import_module(settings.SESSION_ENGINE).SessionStore().exists(session.session_key))
+        response = self.client.get('/api/carts/current/')
+        
+        self.assertEqual(response.json()['id'], cart.pk)
+        self.assertEqual(response.json()['total_price'], 2000.0)
+
+
+class CustomerProfileTest(ShopTestCase):
+    """Профиль текущего пользователя: чтение одним запросом и без записи"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer', email='a@a.com', password='-')
+        CustomerProfile.objects.filter(user=self.user).delete()
+        self.client.force_authenticate(self.user)
+    
+    def test_me_in_one_query(self):
+        CustomerProfile.objects.create(user=self.user, phone_number='123', address='-')
+        
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/profiles/me/')
+        
+        self.assertEqual(response.json()['phone_number'], '123')
+        self.assertEqual(response.json()['email'], 'a@a.com')
+    
+    def test_read_does_not_create(self):
+        response = self.client.get('/api/profiles/me/')
+        
+        self.assertEqual(response.json()['username'], 'buyer')
+        self.assertFalse(CustomerProfile.objects.exists())
+        
+        response = self.client.patch('/api/profiles/update_me/', {'phone_number': '555'})
+        self.assertEqual(response.json()['phone_number'], '555')
+        self.assertEqual(CustomerProfile.objects.get().phone_number, '555')
+
+
+@override_settings(JWT_USER_CLAIMS=True)
+class JWTClaimsTest(ShopTestCase):
+    """Поля пользователя в JWT: отзыв при смене прав и обновлении токена"""
+    
+    def setUp(self):
+        super().setUp()
+        principals.clear()
+        self.admin = User.objects.create_user('admin', password='secret', is_staff=True)
+    
+    def obtain(self):
+        response = self.client.post('/api/token/', {'username': 'admin', 'password': 'secret'})
+        return response.json()
+    
+    def get_stats(self, access):
+        return self.client.get('/api/cache-stats/', HTTP_AUTHORIZATION=f'Bearer {access}')
+    
+    def test_claims_without_queries(self):
+        access = self.obtain()['access']
+        
+        with self.assertNumQueries(0):
+            response = self.get_stats(access)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_demotion_revokes_claims(self):
+        tokens = self.obtain()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_staff = False
+            self.admin.save()
+        self.assertEqual(self.get_stats(tokens['access']).status_code, 403)
+        
+        # Новый access получает поля из БД, а не из refresh
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        principals.clear()
+        caches['default'].clear()
+        self.assertEqual(self.get_stats(response.json()['access']).status_code, 403)
+    
+    def test_deactivation_rejects_tokens(self):
+        tokens = self.obtain()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_active = False
+            self.admin.save()
+        self.assertEqual(self.get_stats(tokens['access']).status_code, 401)
+        
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+    
+    def test_revoke_outlives_refresh_token(self):
+        with mock.patch.object(caches['default'], 'set') as cache_set:
+            principals.revoke(self.admin.pk)
+        timeout = cache_set.call_args.args[2]
+        self.assertGreaterEqual(timeout, settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds())
+    
+    def test_token_delete_revokes(self):
+        token = Token.objects.create(user=self.admin)
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        self.assertEqual(self.client.get('/api/cache-stats/', **auth).status_code, 200)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            token.delete()
+        self.assertEqual(self.client.get('/api/cache-stats/', **auth).status_code, 401)
+    
+    def test_check_requires_shared_cache(self):
+        errors = checks.check_jwt_user_claims(None)
+        
+        self.assertEqual([error.id for error in errors], ['shop.E002'])
+
+
+class CatalogImportTest(ShopTestCase):
+    """Импорт каталога: upsert по артикулу, частичные колонки, конфликты slug"""
+    
+    def setUp(self):
+        super().setUp()
+        self.errors = []
+    
+    def run_import(self, *rows):
+        importer = CatalogImporter(batch_size=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            importer.run(enumerate(rows, 1), on_error=lambda line, exc: self.errors.append((line, str(exc))))
+        return importer
+    
+    def test_upsert(self):
+        row = {'article': 'A-1', 'title': 'Футболка', 'price': '1000', 'color': 'Red', 'size': 'M', 'quantity': '3'}
+        self.run_import(row, dict(row, size='L', quantity='1'))
+        importer = self.run_import(dict(row, title='Футболка 2', price='900', quantity='7'))
+        
+        product = Product.objects.get()
+        self.assertEqual((product.title, product.price), ('Футболка 2', 900))
+        self.assertEqual(product.slug, 'a-1')
+        self.assertEqual(
+            dict(ProductStock.objects.values_list('size__name', 'quantity')), {'M': 7, 'L': 1}
+        )
+        self.assertEqual(product.card.effective_price, 900)
+        self.assertEqual((importer.rows, importer.errors), (1, 0))
+    
+    def test_missing_columns_preserved(self):
+        self.run_import({
+            'article': 'A-1', 'title': 'Футболка', 'price': '1000', 'sale_price': '800',
+            'description': 'Хлопок', 'is_available': 'false',
+            'color': 'Red', 'is_default': 'true', 'size': 'M', 'quantity': '3',
+        })
+        self.run_import({'article': 'A-1', 'title': 'Футболка', 'price': '1100', 'color': 'Red', 'size': 'M'})
+        
+        product = Product.objects.get()
+        self.assertEqual((product.price, product.sale_price), (1100, 800))
+        self.assertEqual(product.description, 'Хлопок')
+        self.assertFalse(product.is_available)
+        self.assertTrue(ProductVariant.objects.get().is_default)
+        self.assertEqual(ProductStock.objects.get().quantity, 3)
+    
+    def test_duplicate_slug_reported(self):
+        create_product('OLD')
+        row = {'title': 'Футболка', 'price': '1000', 'color': 'Red', 'size': 'M'}
+        
+        importer = self.run_import(
+            dict(row, article='A-1', slug='old'),
+            dict(row, article='A-2', slug='new'),
+            dict(row, article='A-3', slug='new'),
+            dict(row, article='A-4'),
+        )
+        
+        self.assertEqual([line for line, _ in self.errors], [1, 3])
+        self.assertEqual(
+            set(Product.objects.values_list('article', flat=True)), {'OLD', 'A-2', 'A-4'}
+        )
+        self.assertEqual((importer.rows, importer.errors), (2, 2))
+    
+    def test_invalidates_cache_per_batch(self):
+        self.assertEqual(self.client.get('/api/products/').json()['results'], [])
+        row = {'article': 'A-1', 'title': 'Футболка', 'price': '1000', 'color': 'Red', 'size': 'M', 'quantity': '1'}
+        
+        importer = CatalogImporter(batch_size=1)
+        # Вторая пачка падает, первая уже зафиксирована
+        with mock.patch('shop.catalog_import.get_search_backend', side_effect=[None, RuntimeError]):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+                importer.run(enumerate([row, dict(row, article='A-2')], 1))
+        
+        self.assertEqual(len(self.client.get('/api/products/').json()['results']), 1)
+
+
+class CatalogFeedTest(ShopTestCase):
+    """Выгрузка каталога для партнёров: доступ, форматы, since"""
+    
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        create_product('A-1', price=1000, sale_price=800, quantity=3)
+    
+    def feed(self, **params):
+        response = self.client.get('/api/products/feed/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_admin_only(self):
+        self.client.force_authenticate(User.objects.create_user('buyer'))
+        
+        self.assertEqual(self.client.get('/api/products/feed/').status_code, 403)
+    
+    def test_jsonl(self):
+        records = [json.loads(line) for line in self.feed().splitlines()]
+        
+        self.assertEqual([record['article'] for record in records], ['A-1'])
+        self.assertEqual(records[0]['effective_price'], '800.00')
+        self.assertEqual(records[0]['variants'][0]['stocks'], [{'size': 'M', 'quantity': 3}])
+    
+    def test_csv(self):
+        lines = self.feed(type='csv').splitlines()
+        
+        self.assertTrue(lines[0].startswith('article,title,slug'))
+        self.assertEqual(len(lines), 2)
+        self.assertIn('A-1,Товар A-1,a-1', lines[1])
+    
+    def test_since(self):
+        past = timezone.now() - timedelta(days=1)
+        Product.objects.update(updated_at=past)
+        ProductCard.objects.update(updated_at=past)
+        create_product('A-2')
+        
+        since = (timezone.now() - timedelta(hours=1)).isoformat()
+        records = [json.loads(line) for line in self.feed(since=since).splitlines()]
+        
+        self.assertEqual([record['article'] for record in records], ['A-2'])
+        self.assertEqual(self.client.get('/api/products/feed/', {'since': 'вчера'}).status_code, 400)
+
+
+class InventoryTest(ShopTestCase):
+    """Пакетное обновление остатков: результат по строкам и режим atomic"""
+    
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        self.stock = ProductStock.objects.get(variant__product=create_product('A-1', quantity=5))
+    
+    def post(self, items, **extra):
+        return self.client.post('/api/inventory/', dict(extra, items=items), format='json')
+    
+    def quantity(self):
+        self.stock.refresh_from_db()
+        return self.stock.quantity
+    
+    def test_results(self):
+        response = self.post([
+            {'article': 'A-1', 'color': 'Red', 'size': 'M', 'delta': -2},
+            {'article': 'B-1', 'color': 'Red', 'size': 'M', 'quantity': 1},
+            {'article': 'A-1', 'color': 'Red', 'size': 'M'},
+            {'article': 'A-1', 'color': 'Red', 'size': 'M', 'delta': -10},
+        ])
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']], ['ok', 'not_found', 'invalid', 'invalid']
+        )
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(self.quantity(), 3)
+    
+    def test_atomic_rollback(self):
+        response = self.post([
+            {'article': 'A-1', 'color': 'Red', 'size': 'M', 'quantity': 1},
+            {'article': 'B-1', 'color': 'Red', 'size': 'M', 'quantity': 1},
+        ], atomic=True)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['applied'])
+        self.assertEqual(self.quantity(), 5)
+    
+    def test_atomic_false_string(self):
+        items = [
+            {'article': 'A-1', 'color': 'Red', 'size': 'M', 'quantity': 1},
+            {'article': 'B-1', 'color': 'Red', 'size': 'M', 'quantity': 1},
+        ]
+        
+        response = self.post(items, atomic='false')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantity(), 1)
+        
+        self.assertEqual(self.post(items, atomic='maybe').status_code, 400)
+    
+    def test_list_body(self):
+        response = self.client.post(
+            '/api/inventory/', [{'article': 'A-1', 'color': 'Red', 'size': 'M', 'quantity': 1}], format='json'
+        )
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantity(), 5)
+
+
+class ImageDerivativesTest(ShopTestCase):
+    """srcset только из манифеста текущего файла"""
+    
+    def manifest(self, name):
+        return {'source': name, 'formats': {'webp': {'320': f'derivatives/{name}/320.webp'}}}
+    
+    def setUp(self):
+        super().setUp()
+        self.product = create_product('A-1')
+        self.image = ProductImage.objects.create(
+            variant=self.product.variants.get(), image='products/old.jpg'
+        )
+        ProductImage.objects.filter(pk=self.image.pk).update(derivatives=self.manifest('products/old.jpg'))
+        self.image.refresh_from_db()
+    
+    def test_replaced_image(self):
+        self.assertIsNotNone(ProductImageSerializer(self.image).data['srcset'])
+        
+        self.image.image = 'products/new.jpg'
+        self.assertIsNone(ProductImageSerializer(self.image).data['srcset'])
+        self.image.save()
+        
+        self.assertEqual(ProductImage.objects.get().derivatives, {})
+    
+    def test_card_skips_stale_manifest(self):
+        ProductImage.objects.update(image='products/new.jpg')
+        ProductCard.objects.refresh([self.product.pk])
+        
+        card = ProductCard.objects.get()
+        self.assertTrue(card.main_image_url.endswith('products/new.jpg'))
+        self.assertEqual(card.main_image_derivatives, {})
+    
+    def test_category_image_cleared(self):
+        category = Category.objects.create(name='Мальчики', slug='boys', image='categories/a.jpg')
+        Category.objects.filter(pk=category.pk).update(derivatives=self.manifest('categories/a.jpg'))
+        category.refresh_from_db()
+        self.assertIsNotNone(CategorySerializer(category).data['image_srcset'])
+        
+        category.image = None
+        category.save()
+        
+        category.refresh_from_db()
+        self.assertEqual(category.derivatives, {})
+        self.assertIsNone(CategorySerializer(category).data['image_srcset'])
@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     CustomerProfileViewSet, CategoryViewSet, ProductViewSet,
     ColorViewSet, SizeViewSet, FavoriteViewSet,
-    CartViewSet, CartItemViewSet, OrderViewSet
+    CartViewSet, CartItemViewSet, OrderViewSet, AuthStatsView, CacheStatsView, InventoryView, TaskStatsView
 )
 
 router = DefaultRouter()
@@ -18,5 +18,9 @@ router.register(r'cart-items', CartItemViewSet, basename='cart-item')
 router.register(r'orders', OrderViewSet, basename='order')
 
 urlpatterns = [
+    path('inventory/', InventoryView.as_view(), name='inventory'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('task-stats/', TaskStatsView.as_view(), name='task-stats'),
+    path('auth-stats/', AuthStatsView.as_view(), name='auth-stats'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,8 +1,20 @@
-from rest_framework import viewsets, permissions, status, filters
+from urllib.parse import urlencode
+
+from rest_framework import viewsets, permissions, serializers, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import Http404, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.text import compress_sequence
 from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import (
@@ -10,66 +22,61 @@ from .models import (
     ProductVariant, ProductStock, Favorite, Cart, CartItem, Order
 )
 from .serializers import (
-    CustomerProfileSerializer, CategorySerializer, ProductListSerializer, 
+    CustomerProfileSerializer, EnhancedCustomerProfileSerializer, CategorySerializer, ProductListSerializer, 
     ProductDetailSerializer, ColorSerializer, SizeSerializer,
     ProductVariantSerializer, FavoriteSerializer, CartSerializer, 
-    CartItemSerializer, OrderSerializer
+    CartItemSerializer, OrderSerializer, InventoryItemSerializer
 )
 from .custom_serializers import CustomUserSerializer
+from .mixins import EagerLoadingMixin, ResponseCacheMixin
+from .authentication import auth_stats
+from .cache import CATALOG_CACHE_NAMESPACE, VersionedCache, stats as cache_stats
+from .search import FullTextSearchFilter
+from .filters import ProductFilter
+from .facets import compute_facets
+from .catalog_export import export_chunks, export_queryset
+from .queue import task_stats
+from .checkout import CheckoutError, place_order
+from .stock import InsufficientStock, apply_inventory, check_available, hold_deadline, lock_stock
 
 
-class CustomerProfileViewSet(viewsets.ModelViewSet):
+class CustomerProfileViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     serializer_class = CustomerProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = None  # Disable pagination for profiles
     
+    def get_serializer_class(self):
+        if self.action in ('me', 'update_me'):
+            return EnhancedCustomerProfileSerializer
+        return self.serializer_class
+    
     def get_queryset(self):
-        # Get or create profile for the current user
-        profile, created = CustomerProfile.objects.get_or_create(
-            user=self.request.user,
-            defaults={
-                'phone_number': '',
-                'address': ''
-            }
-        )
-        return CustomerProfile.objects.filter(user=self.request.user).order_by('id')
+        # Профиль вместе с пользователем одним запросом
+        return self.eager_load(CustomerProfile.objects.filter(user=self.request.user).order_by('id'))
     
     def get_object(self):
-        # Get or create profile for the current user
-        profile, created = CustomerProfile.objects.get_or_create(
-            user=self.request.user,
-            defaults={
-                'phone_number': '',
-                'address': ''
-            }
-        )
+        """
+        Профиль текущего пользователя. Чтение ничего не пишет: если профиля
+        нет, отдаётся пустой несохранённый, создаётся он при изменении
+        """
+        profile = self.get_queryset().first()
+        if profile is None:
+            if self.request.method in permissions.SAFE_METHODS:
+                return CustomerProfile(user=self.request.user, phone_number='', address='')
+            profile, created = CustomerProfile.objects.get_or_create(
+                user=self.request.user,
+                defaults={
+                    'phone_number': '',
+                    'address': ''
+                }
+            )
         return profile
     
     @action(detail=False, methods=['get'])
     def me(self, request):
         """Get current user's profile with enhanced data"""
-        profile = self.get_object()
-        
-        # Return enhanced profile data
-        profile_data = {
-            'id': profile.id,
-            'user': {
-                'id': request.user.id,
-                'username': request.user.username,
-                'email': request.user.email,
-                'first_name': request.user.first_name,
-                'last_name': request.user.last_name,
-            },
-            'phone_number': profile.phone_number,
-            'address': profile.address,
-            # Also include flat structure for easier access
-            'username': request.user.username,
-            'email': request.user.email,
-            'first_name': request.user.first_name,
-            'last_name': request.user.last_name,
-        }
-        
-        return Response(profile_data)
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer.data)
     
     @action(detail=False, methods=['put', 'patch'])
     def update_me(self, request):
@@ -80,86 +87,100 @@ class CustomerProfileViewSet(viewsets.ModelViewSet):
         serializer.save()
         
         # Return the same enhanced format as the me endpoint
-        profile_data = {
-            'id': profile.id,
-            'user': {
-                'id': request.user.id,
-                'username': request.user.username,
-                'email': request.user.email,
-                'first_name': request.user.first_name,
-                'last_name': request.user.last_name,
-            },
-            'phone_number': profile.phone_number,
-            'address': profile.address,
-            'username': request.user.username,
-            'email': request.user.email,
-            'first_name': request.user.first_name,
-            'last_name': request.user.last_name,
-        }
-        
-        return Response(profile_data)
+        return Response(serializer.data)
+
+
+def category_tree(categories, get_serializer):
+    """Вложенное дерево из категорий, отсортированных по path"""
+    nodes = {}
+    roots = []
+    # Сортировка по пути гарантирует, что родитель идёт раньше детей
+    for category in categories:
+        node = dict(get_serializer(category).data, children=[])
+        nodes[category.pk] = node
+        parent = nodes.get(category.parent_id)
+        (parent['children'] if parent else roots).append(node)
+    
+    for node in [*nodes.values(), {'children': roots}]:
+        node['children'].sort(key=lambda child: child['name'])
+    return roots
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all().order_by('name')
     serializer_class = CategorySerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['gender', 'parent']
     search_fields = ['name', 'description']
+    cache_namespace = 'categories'
+    
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """Дерево категорий целиком, одним запросом"""
+        return self.cached_response(request, self.build_tree)
+    
+    def build_tree(self):
+        return Response(category_tree(Category.objects.order_by('path'), self.get_serializer))
     
     @action(detail=False, methods=['get'])
     def boys(self, request):
         """Все категории товаров для мальчиков"""
-        categories = Category.objects.filter(Q(gender='B') | Q(gender='U')).order_by('name')
-        serializer = self.get_serializer(categories, many=True)
-        return Response(serializer.data)
+        return self.cached_response(request, lambda: self.by_gender('B'))
     
     @action(detail=False, methods=['get'])
     def girls(self, request):
         """Все категории товаров для девочек"""
-        categories = Category.objects.filter(Q(gender='G') | Q(gender='U')).order_by('name')
+        return self.cached_response(request, lambda: self.by_gender('G'))
+    
+    def by_gender(self, gender):
+        categories = Category.objects.filter(Q(gender=gender) | Q(gender='U')).order_by('name')
         serializer = self.get_serializer(categories, many=True)
         return Response(serializer.data)
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.filter(is_available=True).order_by('-created_at')
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['categories', 'categories__gender']
+FEED_CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class ProductViewSet(ResponseCacheMixin, EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Product.objects.filter(is_available=True).defer('search_vector').order_by('-created_at')
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
+    filterset_class = ProductFilter
     search_fields = ['title', 'description', 'article']
     ordering_fields = ['price', 'created_at', 'title']
     ordering = ['-created_at']
+    # Границы ценовых диапазонов для фасетов, None - без ограничения
+    facets_price_buckets = [None, 1000, 2000, 3000, 5000, None]
+    facets_ignored_params = {'page', 'page_size', 'ordering', 'format'}
+    cache_namespace = CATALOG_CACHE_NAMESPACE
+    # Остатки и фото меняют только карточку товара
     
     def get_serializer_class(self):
         if self.action == 'list':
             return ProductListSerializer
         return ProductDetailSerializer
     
+    def get_response_cache(self):
+        return VersionedCache(self.cache_namespace, settings.CATALOG_CACHE_TIMEOUT)
+    
     @action(detail=False, methods=['get'])
     def boys(self, request):
         """Фильтр для товаров для мальчиков"""
-        boy_categories = Category.objects.filter(Q(gender='B') | Q(gender='U'))
-        products = Product.objects.filter(
-            categories__in=boy_categories, 
-            is_available=True
-        ).distinct().order_by('-created_at')
-        
-        page = self.paginate_queryset(products)
-        if page is not None:
-            serializer = ProductListSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = ProductListSerializer(products, many=True)
-        return Response(serializer.data)
+        return self.cached_response(request, lambda: self.audience_feed(for_boys=True))
     
     @action(detail=False, methods=['get'])
     def girls(self, request):
         """Фильтр для товаров для девочек"""
-        girl_categories = Category.objects.filter(Q(gender='G') | Q(gender='U'))
+        return self.cached_response(request, lambda: self.audience_feed(for_girls=True))
+    
+    def audience_feed(self, **audience):
         products = Product.objects.filter(
-            categories__in=girl_categories, 
-            is_available=True
-        ).distinct().order_by('-created_at')
+            is_available=True, 
+            **audience
+        ).defer('search_vector').order_by('-created_at')
+        products = self.eager_load(products, ProductListSerializer)
         
         page = self.paginate_queryset(products)
         if page is not None:
@@ -169,25 +190,88 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = ProductListSerializer(products, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Счётчики для фильтров каталога по текущей выборке"""
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            if key not in self.facets_ignored_params
+            for value in values
+        )
+        
+        def build():
+            queryset = self.filter_queryset(self.get_queryset())
+            return compute_facets(queryset, self.facets_price_buckets)
+        
+        # Счётчики в поколении каталога: сбрасываются вместе с остальным кэшем каталога
+        facets_cache = VersionedCache(self.cache_namespace, settings.FACETS_CACHE_TIMEOUT)
+        data = facets_cache.get_or_set('facets|' + urlencode(params), build)
+        return Response(data)
+    
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def feed(self, request):
+        """
+        Потоковая выгрузка каталога для партнёров: ?type=jsonl|csv,
+        ?since=<дата ISO 8601> - только изменённые с этого момента товары.
+        Заголовок X-Export-Time - since для следующей выгрузки.
+        Выгрузка с since не сообщает об удалённых товарах и об изменении
+        одних только категорий товара: их даёт только полная выгрузка.
+        """
+        fmt = request.query_params.get('type', 'jsonl')
+        if fmt not in FEED_CONTENT_TYPES:
+            return Response({'error': 'type: jsonl или csv'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_datetime(since.replace(' ', '+'))
+            except ValueError:
+                since = None
+            if since is None:
+                return Response({'error': 'since: дата в формате ISO 8601'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        
+        # Время до выборки: изменения во время выгрузки попадут в следующую
+        export_time = timezone.now()
+        chunks = export_chunks(export_queryset(since or None), fmt, request.build_absolute_uri)
+        gzipped = re_accepts_gzip.search(request.headers.get('Accept-Encoding', ''))
+        response = StreamingHttpResponse(
+            compress_sequence(chunks) if gzipped else chunks, content_type=FEED_CONTENT_TYPES[fmt]
+        )
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        response['Content-Disposition'] = f'attachment; filename="catalog.{fmt}"'
+        response['X-Export-Time'] = export_time.isoformat()
+        return response
+    
     @action(detail=True, methods=['get'])
     def variants(self, request, pk=None):
-        product = self.get_object()
-        variants = product.variants.all().order_by('id')
+        return self.cached_response(request, lambda: self.build_variants(pk))
+    
+    def build_variants(self, pk):
+        product = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(self.request, product)
+        variants = self.eager_load(product.variants.all().order_by('id'), ProductVariantSerializer)
         serializer = ProductVariantSerializer(variants, many=True)
         return Response(serializer.data)
 
 
-class ColorViewSet(viewsets.ReadOnlyModelViewSet):
+class ColorViewSet(ResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Color.objects.all().order_by('name')
     serializer_class = ColorSerializer
+    cache_namespace = 'colors'
 
 
-class SizeViewSet(viewsets.ReadOnlyModelViewSet):
+class SizeViewSet(ResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Size.objects.all().order_by('display_order')
     serializer_class = SizeSerializer
+    cache_namespace = 'sizes'
 
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     serializer_class = FavoriteSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -214,37 +298,80 @@ class FavoriteViewSet(viewsets.ModelViewSet):
             return Response({'status': 'добавлен'}, status=status.HTTP_201_CREATED)
 
 
-class CartViewSet(viewsets.ModelViewSet):
-    serializer_class = CartSerializer
+def cart_owner(user, session):
+    """Условие на корзину покупателя, None - у анонима без сессии корзины нет"""
+    if user.is_authenticated:
+        return {'user': user}
+    if session.session_key:
+        return {'session_id': session.session_key}
+    return None
+
+
+def empty_cart_data(user):
+    """Ответ для корзины, которой ещё нет в БД"""
+    return {
+        'id': None,
+        'user': user.pk if user.is_authenticated else None,
+        'session_id': None,
+        'items': [],
+        'total_price': 0.0,
+        'created_at': None,
+        'updated_at': None,
+    }
+
+
+def get_or_create_user_cart(user):
+    """
+    Корзина пользователя, вызывается внутри транзакции. Cart.user не уникален,
+    поэтому параллельные запросы сериализуются блокировкой строки пользователя.
+    """
+    User.objects.select_for_update().filter(pk=user.pk).exists()
+    cart, created = Cart.objects.get_or_create(user=user)
+    return cart
+
+
+class CartOwnerMixin:
+    """
+    Чтение корзины без записи в БД, создание сессии и корзины
+    анонима - только при первом добавлении товара
+    """
     
-    def get_queryset(self):
+    def find_carts(self):
+        owner = cart_owner(self.request.user, self.request.session)
+        if owner is None:
+            return Cart.objects.none()
+        return Cart.objects.filter(**owner)
+    
+    def get_or_create_cart(self):
         if self.request.user.is_authenticated:
-            return Cart.objects.filter(user=self.request.user).order_by('-updated_at')
-        
-        session_id = self.request.session.session_key
-        if not session_id:
+            with transaction.atomic():
+                return get_or_create_user_cart(self.request.user)
+        if not self.request.session.session_key:
             self.request.session.create()
-            session_id = self.request.session.session_key
-        
-        return Cart.objects.filter(session_id=session_id).order_by('-updated_at')
+        cart, created = Cart.objects.get_or_create(**cart_owner(self.request.user, self.request.session))
+        return cart
+
+
+class CartViewSet(CartOwnerMixin, EagerLoadingMixin, viewsets.ModelViewSet):
+    serializer_class = CartSerializer
+    
+    def get_queryset(self):
+        return self.find_carts().order_by('-updated_at')
+    
+    def get_current(self):
+        return self.eager_load(self.get_queryset()).first()
     
     def get_object(self):
-        queryset = self.get_queryset()
-        cart = queryset.first()
-        
-        if not cart:
-            # Создание новой корзины
-            if self.request.user.is_authenticated:
-                cart = Cart.objects.create(user=self.request.user)
-            else:
-                session_id = self.request.session.session_key
-                cart = Cart.objects.create(session_id=session_id)
-        
+        cart = self.get_current()
+        if cart is None:
+            raise Http404
         return cart
     
     @action(detail=False, methods=['get'])
     def current(self, request):
-        cart = self.get_object()
+        cart = self.get_current()
+        if cart is None:
+            return Response(empty_cart_data(request.user))
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
     
@@ -261,93 +388,160 @@ class CartViewSet(viewsets.ModelViewSet):
         if not session_id:
             return Response({'message': 'Нет добавленных товаров'})
         
-        # Поиск товаров в корзине до регистрации
-        anonymous_cart = Cart.objects.filter(session_id=session_id).first()
-        if not anonymous_cart or not anonymous_cart.items.exists():
-            return Response({'message': 'Нет добавленных товаров'})
-        
-        # Поиск/создание корзины
-        user_cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        # Сохранение корзины анонимного пользователя после авторизации
-        for anon_item in anonymous_cart.items.all():
-            # Проверка товара на сущестовавание товара в корзине
-            user_item = user_cart.items.filter(
-                product_stock=anon_item.product_stock
-            ).first()
-            
-            if user_item:
-                # Увелечение количества товаров
-                user_item.quantity += anon_item.quantity
-                user_item.save()
-            else:
-                # Добавление товара в корзину
-                anon_item.cart = user_cart
-                anon_item.save()
-        
-        # Удаление корзины не зарегистрированного пользователя
-        anonymous_cart.delete()
+        try:
+            with transaction.atomic():
+                # Корзины блокируются до чтения товаров: параллельное слияние
+                # ждёт здесь и уже не находит удалённую анонимную корзину
+                anonymous_cart = Cart.objects.select_for_update().filter(session_id=session_id).first()
+                if not anonymous_cart:
+                    return Response({'message': 'Нет добавленных товаров'})
+                
+                anon_items = list(
+                    CartItem.objects.filter(cart=anonymous_cart)
+                    .values_list('product_stock_id', 'quantity', 'reserved_until')
+                )
+                if not anon_items:
+                    return Response({'message': 'Нет добавленных товаров'})
+                
+                # Поиск/создание корзины под блокировкой пользователя
+                user_cart = get_or_create_user_cart(request.user)
+                
+                # Остатки блокируются так же, как при добавлении товара в корзину,
+                # поэтому количества ниже не устареют до записи
+                stocks = {stock.pk: stock for stock in lock_stock([item[0] for item in anon_items])}
+                
+                # Удаление корзины не зарегистрированного пользователя: её удержания
+                # не должны считаться чужими при проверке остатка. При нехватке
+                # товара транзакция откатывается вместе с удалением
+                anonymous_cart.delete()
+                
+                # Товары, которые уже есть в корзине пользователя
+                existing = {
+                    product_stock_id: (quantity, reserved_until)
+                    for product_stock_id, quantity, reserved_until in CartItem.objects.filter(
+                        cart=user_cart,
+                        product_stock_id__in=stocks
+                    ).values_list('product_stock_id', 'quantity', 'reserved_until')
+                }
+                
+                # Сохранение корзины анонимного пользователя одним upsert:
+                # количество суммируется, удержание берётся более позднее
+                merged = []
+                missing = []
+                for product_stock_id, quantity, reserved_until in anon_items:
+                    user_quantity, user_reserved_until = existing.get(product_stock_id, (0, None))
+                    holds = [hold for hold in (reserved_until, user_reserved_until) if hold]
+                    quantity += user_quantity
+                    try:
+                        check_available(user_cart, stocks[product_stock_id], quantity)
+                    except InsufficientStock:
+                        missing.append(product_stock_id)
+                    merged.append(CartItem(
+                        cart=user_cart,
+                        product_stock_id=product_stock_id,
+                        quantity=quantity,
+                        reserved_until=max(holds) if holds else None,
+                    ))
+                if missing:
+                    raise InsufficientStock(missing)
+                
+                CartItem.objects.bulk_create(
+                    merged,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product_stock'],
+                    update_fields=['quantity', 'reserved_until'],
+                )
+        except InsufficientStock as e:
+            return Response(
+                {'error': str(e), 'product_stock_ids': e.product_stock_ids}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # Обновление корзины пользователя
+        user_cart = self.eager_load(Cart.objects.filter(pk=user_cart.pk)).get()
         serializer = self.get_serializer(user_cart)
         return Response(serializer.data)
 
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(CartOwnerMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     
     def get_queryset(self):
-        cart = self.get_cart()
-        return CartItem.objects.filter(cart=cart).order_by('-added_at')
-    
-    def get_cart(self):
-        if self.request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=self.request.user)
-        else:
-            session_id = self.request.session.session_key
-            if not session_id:
-                self.request.session.create()
-                session_id = self.request.session.session_key
-            
-            cart, created = Cart.objects.get_or_create(session_id=session_id)
-        
-        return cart
+        return CartItem.objects.filter(cart__in=self.find_carts()).order_by('-added_at')
     
     def create(self, request, *args, **kwargs):
-        cart = self.get_cart()
-        
         # Добавить информацию о корзине для запроса 
         mutable_data = request.data.copy()
         
         serializer = self.get_serializer(data=mutable_data)
         serializer.is_valid(raise_exception=True)
+        # Корзина появляется только при добавлении товара
+        cart = self.get_or_create_cart()
         
-        # Проверка существует ли товар в корзине
-        product_stock_id = serializer.validated_data['product_stock'].id
-        existing_item = CartItem.objects.filter(
-            cart=cart, 
-            product_stock_id=product_stock_id
-        ).first()
+        product_stock = serializer.validated_data['product_stock']
+        quantity = serializer.validated_data.get('quantity', 1)
+        
+        try:
+            with transaction.atomic():
+                # Блокировка остатка, чтобы параллельные добавления не превысили склад
+                product_stock, = lock_stock([product_stock.pk])
+                
+                # Проверка существует ли товар в корзине
+                existing_item = CartItem.objects.filter(
+                    cart=cart, 
+                    product_stock_id=product_stock.id
+                ).first()
+                
+                if existing_item:
+                    quantity += existing_item.quantity
+                check_available(cart, product_stock, quantity)
+                
+                if existing_item:
+                    # Увеличеть количество
+                    existing_item.quantity = quantity
+                    existing_item.reserved_until = hold_deadline()
+                    existing_item.save()
+                else:
+                    # Create new item
+                    serializer.save(cart=cart, reserved_until=hold_deadline())
+        except InsufficientStock as e:
+            return Response(
+                {'error': str(e), 'product_stock_ids': e.product_stock_ids}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         if existing_item:
-            # Увеличеть количество
-            existing_item.quantity += serializer.validated_data.get('quantity', 1)
-            existing_item.save()
-            response_serializer = self.get_serializer(existing_item)
+            response_serializer = self.get_serializer(self.eager_load_object(existing_item))
             return Response(response_serializer.data)
         
-        # Create new item
-        serializer.save(cart=cart)
-        
         headers = self.get_success_headers(serializer.data)
         return Response(
             serializer.data, 
             status=status.HTTP_201_CREATED, 
             headers=headers
         )
+    
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        quantity = serializer.validated_data.get('quantity', instance.quantity)
+        product_stock = serializer.validated_data.get('product_stock', instance.product_stock)
+        
+        with transaction.atomic():
+            product_stock, = lock_stock([product_stock.pk])
+            check_available(instance.cart, product_stock, quantity)
+            serializer.save(reserved_until=hold_deadline())
+    
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except InsufficientStock as e:
+            return Response(
+                {'error': str(e), 'product_stock_ids': e.product_stock_ids}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -355,50 +549,100 @@ class OrderViewSet(viewsets.ModelViewSet):
         return Order.objects.filter(user=self.request.user).order_by('-created_at')
     
     def create(self, request, *args, **kwargs):
-        # Получение текущей корзины
-        try:
-            cart = Cart.objects.get(user=request.user)
-        except Cart.DoesNotExist:
-            return Response(
-                {'error': 'No cart found'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        if not cart.items.exists():
-            return Response(
-                {'error': 'Cart is empty'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Создание заказа
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        order = serializer.save(
-            user=request.user,
-            total_price=cart.total_price
-        )
         
-        # Создание товаров в заказе из корзины
-        for cart_item in cart.items.all():
-            product_stock = cart_item.product_stock
-            product = product_stock.variant.product
-            variant = product_stock.variant
-            size = product_stock.size
-            price = product.sale_price if product.sale_price else product.price
-            
-            # Создание товаров в заказе
-            order.items.create(
-                product=product,
-                variant=variant,
-                size=size,
-                price=price,
-                quantity=cart_item.quantity
+        # Создание заказа из корзины
+        try:
+            order = place_order(request.user, serializer)
+        except CheckoutError as e:
+            return Response(
+                {'error': str(e), 'product_stock_ids': e.product_stock_ids}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Очистка корзины
-        cart.items.all().delete()
+        self.eager_load_object(order)
         
         return Response(
             serializer.data, 
             status=status.HTTP_201_CREATED
-        )
\ No newline at end of file
+        )
+
+
+class InventoryView(APIView):
+    """
+    Пакетное обновление остатков для синхронизации со складом.
+    {"items": [{"article", "color", "size", "quantity" | "delta"}, ...], "atomic": false}
+    Ответ - результат по каждой строке в порядке запроса.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    max_items = 10000
+    
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Тело запроса - объект {"items": [...]}'}, status=status.HTTP_400_BAD_REQUEST)
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'items: непустой список строк'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_items:
+            return Response(
+                {'error': f'Не больше {self.max_items} строк за запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            # Строка "false" из формы - не atomic
+            atomic = serializers.BooleanField().to_internal_value(request.data.get('atomic', False))
+        except serializers.ValidationError:
+            return Response({'error': 'atomic: true или false'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = [None] * len(items)
+        valid_rows = []
+        valid_indexes = []
+        for index, item in enumerate(items):
+            serializer = InventoryItemSerializer(data=item)
+            if serializer.is_valid():
+                valid_rows.append(serializer.validated_data)
+                valid_indexes.append(index)
+            else:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+        
+        applied = False
+        if valid_rows and not (atomic and len(valid_rows) < len(items)):
+            row_results, applied = apply_inventory(valid_rows, atomic=atomic)
+            for index, result in zip(valid_indexes, row_results):
+                results[index] = dict(result, index=index)
+        if not applied:
+            # Верные строки не записаны из-за ошибок в других
+            for index in valid_indexes:
+                if results[index] is None or results[index]['status'] == 'ok':
+                    results[index] = {'index': index, 'status': 'skipped'}
+        
+        data = {
+            'applied': applied,
+            'updated': sum(1 for result in results if result['status'] == 'ok') if applied else 0,
+            'results': results,
+        }
+        return Response(data, status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST)
+
+
+class CacheStatsView(APIView):
+    """Счётчики кэша текущего процесса для мониторинга"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response(cache_stats.snapshot())
+
+
+class AuthStatsView(APIView):
+    """Время аутентификации по схемам в текущем процессе"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response(auth_stats.snapshot())
+
+
+class TaskStatsView(APIView):
+    """Счётчики и время выполнения фоновых задач"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response(task_stats())